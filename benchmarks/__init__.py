@@ -0,0 +1,16 @@
+"""
+    Benchmarks for the framework. Run them from the root of the repository, eg:
+    
+        python -m benchmarks.model_plans
+"""
+import os
+import timeit
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', "mock_settings")
+
+def best_of(func, repeat=5, number=1):
+    """
+        Returns the best time in seconds of `repeat` runs of calling
+        `func` `number` times.
+    """
+    return min(timeit.repeat(func, repeat=repeat, number=number))
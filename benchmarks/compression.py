@@ -0,0 +1,46 @@
+"""
+    The size of a few hundred KB of indented events and the time to compress
+    it with each available content coding at a few levels, and whole
+    requests through a Resource with and without compression.
+"""
+from __future__ import print_function
+
+import benchmarks
+from benchmarks.models import make_events
+
+from tests.basic import Request
+
+import rest_framework
+
+class PrettyEmitter(rest_framework.Emitter):
+    pretty = True
+
+class EventHandler(rest_framework.BaseHandler):
+    n = 0
+    
+    def read(self, request):
+        return make_events(self.n)
+
+class EventResource(rest_framework.Resource):
+    output = {'default': PrettyEmitter}
+
+def main(n=2000):
+    resource = EventResource(EventHandler)
+    resource.handler.n = n
+    body = PrettyEmitter().render({'data': rest_framework.Emitter()._construct(make_events(n))}).encode('utf-8')
+    print("%s events, %d bytes" % (n, len(body)))
+    for encoding in sorted(rest_framework.compressors):
+        for level in (1, 6, 9):
+            resource.compress_level = level
+            compress = lambda: resource.compressed(body, encoding)
+            print("%-8s %2s %9d bytes %8.2fms" % (encoding, level, len(compress()), benchmarks.best_of(compress) * 1e3))
+    
+    resource.compress_level = EventResource.compress_level
+    for accept_encoding in ("identity", "gzip"):
+        request = Request("get")
+        request.META = {'HTTP_ACCEPT_ENCODING': accept_encoding}
+        seconds = benchmarks.best_of(lambda: resource(request), number=10) / 10
+        print("Accept-Encoding: %-8s %8.2fms per request" % (accept_encoding, seconds * 1e3))
+
+if __name__ == '__main__':
+    main()
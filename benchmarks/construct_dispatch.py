@@ -0,0 +1,62 @@
+"""
+    Compares `Emitter.construct` on mixed nested payloads against the chain
+    of isinstance checks it used before dispatching on type.
+"""
+from __future__ import print_function
+
+import datetime
+import decimal
+
+import benchmarks
+
+from django.db.models import Model
+from django.db.models.query import QuerySet
+from django.utils.encoding import smart_unicode
+
+import rest_framework
+
+class IsinstanceEmitter(rest_framework.Emitter):
+    """
+        `construct` as it was before the dispatch table.
+    """
+    def construct(self, thing):
+        if isinstance(thing, str):
+            return thing
+        elif isinstance(thing, QuerySet):
+            return self._qs(thing)
+        elif isinstance(thing, (tuple, list)):
+            return self._list(thing)
+        elif isinstance(thing, dict):
+            return self._dict(thing)
+        elif isinstance(thing, decimal.Decimal):
+            return self._decimal(thing)
+        elif isinstance(thing, Model):
+            return self._model(thing)
+        elif isinstance(thing, datetime.datetime):
+            return self._datetime(thing)
+        elif isinstance(thing, datetime.date):
+            return self._date(thing)
+        elif isinstance(thing, datetime.time):
+            return self._time(thing)
+        return smart_unicode(thing, strings_only=True)
+
+def payload(n):
+    return [{'id': i, 'name': u"event %s" % i, 'score': i / 3.0, 'active': i % 2 == 0,
+             'price': decimal.Decimal("9.99"), 'tags': [u"music", u"free", None],
+             'day': datetime.date(2012, 5, 4), 'venue': {'id': i % 30, 'capacity': 500,
+                                                         'location': (51.5, -0.12)}}
+            for i in range(n)]
+
+def main(n=5000):
+    data = payload(n)
+    assert rest_framework.Emitter().construct(data) == IsinstanceEmitter().construct(data)
+    
+    chain = benchmarks.best_of(lambda: IsinstanceEmitter().construct(data))
+    dispatch = benchmarks.best_of(lambda: rest_framework.Emitter().construct(data))
+    print("%s nested payloads" % n)
+    print("isinstance chain: %.2fms" % (chain * 1e3))
+    print("dispatch table:   %.2fms" % (dispatch * 1e3))
+    print("speedup:          %.2fx" % (chain / dispatch))
+
+if __name__ == '__main__':
+    main()
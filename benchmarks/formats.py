@@ -0,0 +1,45 @@
+"""
+    Compares the size of representative emitter output and the time to
+    render it as indented and compact json and as MessagePack, with the
+    msgpack package if it is installed and with the pure python encoder, and
+    the time for a client to decode it again.
+"""
+from __future__ import print_function
+
+import json
+
+import benchmarks
+from benchmarks.models import make_events
+
+import rest_framework
+
+def main(n=5000):
+    data = {'data': rest_framework.Emitter()._construct(make_events(n))}
+    
+    class JsonEmitter(rest_framework.Emitter):
+        pretty = False
+    class PrettyEmitter(rest_framework.Emitter):
+        pretty = True
+    renderers = [("indented json", PrettyEmitter().render, json.loads),
+                 ("compact json", JsonEmitter().render, json.loads)]
+    try:
+        import msgpack
+    except ImportError:
+        print("msgpack isn't installed, only the pure python encoder is compared")
+    else:
+        loads = lambda data: msgpack.unpackb(data, raw=False)
+        renderers.append(("msgpack", rest_framework.msgpack_dumps, loads))
+        renderers.append(("msgpack (py)", rest_framework._msgpack_dumps, loads))
+    if len(renderers) == 2:
+        renderers.append(("msgpack (py)", rest_framework._msgpack_dumps, None))
+    
+    print("%s events" % n)
+    print("%-14s %9s %10s %10s" % ("", "bytes", "encode", "decode"))
+    for name, dumps, loads in renderers:
+        rendered = dumps(data)
+        encode = benchmarks.best_of(lambda: dumps(data)) * 1e3
+        decode = "%8.2fms" % (benchmarks.best_of(lambda: loads(rendered)) * 1e3) if loads else "-"
+        print("%-14s %9d %8.2fms %10s" % (name, len(rendered), encode, decode))
+
+if __name__ == '__main__':
+    main()
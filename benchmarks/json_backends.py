@@ -0,0 +1,31 @@
+"""
+    Compares rendering representative emitter output with each of the
+    available json backends, compact and indented.
+"""
+from __future__ import print_function
+
+import benchmarks
+from benchmarks.models import make_events
+
+import rest_framework
+
+def main(n=5000):
+    data = {'data': rest_framework.Emitter()._construct(make_events(n))}
+    
+    class PrettyEmitter(rest_framework.Emitter):
+        pretty = True
+    pretty = PrettyEmitter()
+    print("%s events" % n)
+    print("%-12s %8.2fms %9d bytes" % ("indented", benchmarks.best_of(lambda: pretty.render(data)) * 1e3,
+                                       len(pretty.render(data))))
+    
+    for name in sorted(rest_framework.json_backends):
+        class BackendEmitter(rest_framework.Emitter):
+            json_backend = name
+            pretty = False
+        emitter = BackendEmitter()
+        print("%-12s %8.2fms %9d bytes" % (name, benchmarks.best_of(lambda: emitter.render(data)) * 1e3,
+                                           len(emitter.render(data))))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""
+    Constructing events from the database whose massager constructs their
+    location, with 30 locations between them, with and without memoizing
+    the repeated locations. Memoizing only pays for itself when the
+    repeated models cost more to construct than to copy, eg. when their
+    massager makes a query:
+
+        python -m benchmarks.memoize
+"""
+from __future__ import print_function
+
+import benchmarks
+from benchmarks.models import BenchEvent, BenchLocation
+from benchmarks.pipeline import LocationEmitter, create_events
+
+class MassagedLocationEmitter(LocationEmitter):
+    def setup(self):
+        super(MassagedLocationEmitter, self).setup()
+        self.massagers[BenchLocation] = self.massage_location
+
+    def massage_location(self, model_dict, model_instance):
+        model_dict['events'] = model_instance.benchevent_set.count()
+        return model_dict
+
+def variants(emitter_class):
+    class Unmemoized(emitter_class):
+        memoize = False
+    class Memoized(emitter_class):
+        memoize = True
+    class Shared(emitter_class):
+        memoize = True
+        memoize_shared = True
+    return Unmemoized, Memoized, Shared
+
+def main(n=5000, rounds=3):
+    create_events(n)
+    # fetched once, so only constructing is timed
+    events = list(BenchEvent.objects.all())
+    for emitter_class in (LocationEmitter, MassagedLocationEmitter):
+        unmemoized, memoized, shared = variants(emitter_class)
+        variants_ = [("unmemoized", unmemoized), ("memoized", memoized), ("shared", shared)]
+        expected = unmemoized()._construct(events)
+        best = {}
+        # the variants take turns, so they all see the same noise, after a
+        # warm up round that isn't counted
+        for i in range(rounds + 1):
+            for name, variant in variants_:
+                assert variant()._construct(events) == expected
+                seconds = benchmarks.best_of(lambda: variant()._construct(events), repeat=1, number=1)
+                if i:
+                    best[name] = min(best.get(name, seconds), seconds)
+        print(emitter_class.__name__)
+        for name, variant in variants_:
+            print("    %-12s %8.2fms" % (name, best[name] * 1e3))
+
+if __name__ == '__main__':
+    main()
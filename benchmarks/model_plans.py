@@ -0,0 +1,38 @@
+"""
+    Compares serializing model instances through the cached serialization
+    plans against walking `_meta.fields` for every instance.
+"""
+from __future__ import print_function
+
+import benchmarks
+from benchmarks.models import make_events
+
+import rest_framework
+
+class UnplannedEmitter(rest_framework.Emitter):
+    """
+        `_model` as it was before serialization plans.
+    """
+    def _model(self, data):
+        ret = {}
+        for f in data._meta.fields:
+            if f.attname not in self.exclude_fields:
+                ret[f.attname] = self.construct(getattr(data, f.attname))
+        if type(data) in self.massagers:
+            ret = self.massagers[type(data)](ret, data)
+        return ret
+
+def main(n=5000):
+    events = make_events(n)
+    assert rest_framework.Emitter().construct(events) == UnplannedEmitter().construct(events)
+    
+    unplanned = benchmarks.best_of(lambda: UnplannedEmitter().construct(events))
+    planned = benchmarks.best_of(lambda: rest_framework.Emitter().construct(events))
+    
+    print("%s models" % n)
+    print("unplanned: %.2fus per row" % (unplanned / n * 1e6))
+    print("planned:   %.2fus per row" % (planned / n * 1e6))
+    print("speedup:   %.2fx" % (unplanned / planned))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,31 @@
+import datetime
+import decimal
+
+from django.db import models
+
+class BenchLocation(models.Model):
+    name            =   models.CharField(max_length=100)
+    lat             =   models.FloatField()
+    lng             =   models.FloatField()
+
+class BenchEvent(models.Model):
+    name            =   models.CharField(max_length=100)
+    description     =   models.TextField()
+    start           =   models.DateTimeField()
+    end             =   models.DateTimeField()
+    day             =   models.DateField()
+    price           =   models.DecimalField(max_digits=6, decimal_places=2)
+    capacity        =   models.IntegerField()
+    active          =   models.BooleanField()
+    location        =   models.ForeignKey(BenchLocation)
+
+def make_events(n):
+    """
+        `n` unsaved events, each with every field filled in.
+    """
+    start = datetime.datetime(2012, 5, 4, 20, 30)
+    return [BenchEvent(id=i, name="event %s" % i, description=u"description",
+                       start=start, end=start + datetime.timedelta(hours=3),
+                       day=start.date(), price=decimal.Decimal("12.50"),
+                       capacity=i % 500, active=True, location_id=i % 30)
+            for i in xrange(n)]
@@ -0,0 +1,185 @@
+"""
+    Requests per second, time per phase and peak memory of whole requests
+    through a Resource, against an in-memory SQLite database:
+
+        python -m benchmarks.pipeline
+        python -m benchmarks.pipeline --save baseline.json
+        python -m benchmarks.pipeline --compare baseline.json
+
+    Each scenario runs in its own process, so its peak memory isn't mixed up
+    with the others'.
+"""
+from __future__ import print_function
+
+import argparse
+import collections
+import json
+import logging
+import multiprocessing
+import resource
+
+import benchmarks
+from benchmarks.models import BenchEvent, BenchLocation, make_events
+
+from django.db import connection
+from django.core.management.color import no_style
+
+from tests.basic import Request
+
+import rest_framework
+
+def create_events(n):
+    cursor = connection.cursor()
+    for model in (BenchLocation, BenchEvent):
+        statements, references = connection.creation.sql_create_model(model, no_style())
+        for statement in statements:
+            cursor.execute(statement)
+    BenchLocation.objects.bulk_create([BenchLocation(id=i, name="venue %s" % i, lat=51.5, lng=-0.12)
+                                       for i in range(30)])
+    events = make_events(n)
+    for start in range(0, n, 500):
+        BenchEvent.objects.bulk_create(events[start:start + 500])
+
+class LocationEmitter(rest_framework.Emitter):
+    def setup(self):
+        self.manips = [self.get_locations]
+        self.massagers = {BenchEvent: self.massage_event}
+
+    def get_locations(self):
+        self.data['locations'] = BenchLocation.objects.in_bulk(list(self.ids['locations']))
+
+    def massage_event(self, model_dict, model_instance):
+        if self.collecting:
+            self.ids['locations'].add(model_dict['location_id'])
+        else:
+            model_dict['location'] = self.construct(self.data['locations'][model_dict.pop('location_id')])
+        return model_dict
+
+def nested(depth, width):
+    if depth == 0:
+        return {'id': width, 'name': u"leaf", 'score': 0.5, 'tags': [u"a", u"b", None]}
+    return {'depth': depth, 'children': [nested(depth - 1, width) for i in range(width)]}
+
+class Handler(rest_framework.BaseHandler):
+    n = 0
+
+    def read(self, request):
+        kind = request.REQUEST['kind']
+        if kind == 'scalar':
+            return {'status': u"ok", 'count': 3}
+        elif kind == 'models':
+            return BenchEvent.objects.all()
+        elif kind == 'nested':
+            return nested(4, 6)
+        elif kind == 'api error':
+            raise rest_framework.DoesNotExist("event", id=self.n)
+        elif kind == 'crash':
+            return 1 / 0
+
+    def create(self, request):
+        return len(request.data)
+
+class PipelineResource(rest_framework.Resource):
+    output = {'default': rest_framework.Emitter, 'located': LocationEmitter}
+
+def scenarios(n):
+    """
+        name -> (GET parameters, POST body or None)
+    """
+    body = json.dumps([{'name': "event %s" % i, 'capacity': i, 'tags': ["a", "b"]} for i in range(n)])
+    return collections.OrderedDict([
+        ('scalar', ({'kind': 'scalar'}, None)),
+        ('models', ({'kind': 'models'}, None)),
+        ('models with manips', ({'kind': 'models', 'output': 'located'}, None)),
+        ('nested payload', ({'kind': 'nested'}, None)),
+        ('large POST', ({}, body)),
+        ('api error', ({'kind': 'api error'}, None)),
+        ('crash', ({'kind': 'crash'}, None)),
+    ])
+
+def run_scenario(name, n, number, results):
+    """
+        Runs one scenario `number` times (after a warm up), putting its
+        results on `results`.
+    """
+    logging.getLogger('shimmer').setLevel(logging.CRITICAL)
+    create_events(n)
+    params, body = scenarios(n)[name]
+    metrics = rest_framework.MemoryMetrics()
+
+    class Measured(PipelineResource):
+        pass
+    Measured.metrics = metrics
+    endpoint = Measured(Handler)
+    endpoint.handler.n = n
+
+    def call():
+        if body is None:
+            request = Request("get")
+        else:
+            request = Request("post", body)
+        request.set_get(**params)
+        return endpoint(request)
+
+    call()
+    metrics.timings.clear()
+    memory_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    seconds = benchmarks.best_of(call, repeat=3, number=number)
+    prefix = 'shimmer.Handler.'
+    phases = dict((timing[len(prefix):], sum(values) / len(values) * 1e3)
+                  for timing, values in metrics.timings.items())
+    results.put({'name': name,
+                 'requests/s': number / seconds,
+                 'phases (ms)': phases,
+                 'peak memory (KB)': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                 'memory growth (KB)': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - memory_before})
+
+def run(n, number):
+    results = []
+    for name in scenarios(n):
+        queue = multiprocessing.Queue()
+        process = multiprocessing.Process(target=run_scenario, args=(name, n, number, queue))
+        process.start()
+        results.append(queue.get())
+        process.join()
+    return results
+
+def change(new, old):
+    if not old:
+        return ''
+    return ' (%+.1f%%)' % ((new - old) / float(old) * 100)
+
+def report(results, baseline=None):
+    baseline = dict((result['name'], result) for result in baseline or [])
+    for result in results:
+        old = baseline.get(result['name'], {})
+        print(result['name'])
+        print("    %-20s %.0f%s" % ("requests/s", result['requests/s'],
+                                    change(result['requests/s'], old.get('requests/s'))))
+        for key in ('peak memory (KB)', 'memory growth (KB)'):
+            print("    %-20s %s%s" % (key, result[key], change(result[key], old.get(key))))
+        old_phases = old.get('phases (ms)', {})
+        for phase, ms in sorted(result['phases (ms)'].items(), key=lambda item: -item[1]):
+            print("    %-20s %.3fms%s" % (phase, ms, change(ms, old_phases.get(phase))))
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks whole requests through a Resource.")
+    parser.add_argument('-n', type=int, default=1000, help="rows and POSTed items per request")
+    parser.add_argument('--number', type=int, default=20, help="requests per timing")
+    parser.add_argument('--save', metavar='FILE', help="save the results as a baseline")
+    parser.add_argument('--compare', metavar='FILE', help="compare the results with a baseline")
+    args = parser.parse_args()
+
+    results = run(args.n, args.number)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    report(results, baseline)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=4)
+
+if __name__ == '__main__':
+    main()
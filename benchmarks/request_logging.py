@@ -0,0 +1,94 @@
+"""
+    Requests per second through a Resource with logging at WARNING: as it was
+    before the named loggers (every message sent to the root logger, with
+    its arguments formatted first), with the phase tracing, and without it,
+    then with everything logged at INFO.
+"""
+from __future__ import print_function
+
+import logging
+
+import benchmarks
+
+from tests.basic import Request
+
+import rest_framework
+
+class EventHandler(rest_framework.BaseHandler):
+    def read(self, request):
+        return [{'id': i, 'name': u"event %s" % i} for i in range(10)]
+
+class RootLoggingEmitter(rest_framework.Emitter):
+    """
+        Makes the calls to the root logger a GET used to make in the emitter.
+    """
+    def _construct(self, data):
+        logging.info("pre constructing (enter)")
+        logging.info("pre constructing (exit)")
+        logging.info("overall constructing (enter)")
+        logging.debug("constructing (enter)")
+        output = super(RootLoggingEmitter, self)._construct(data)
+        logging.debug("constructing (exit)")
+        logging.debug("overall constructing (exit)")
+        return output
+
+    def render(self, data):
+        logging.info("render (start)")
+        seria = super(RootLoggingEmitter, self).render(data)
+        logging.info("rendered %s characters (end)" % len(seria))
+        return seria
+
+class RootLoggingResource(rest_framework.Resource):
+    """
+        And in the resource.
+    """
+    output = {'default': RootLoggingEmitter}
+
+    def _respond(self, request, *args, **kwargs):
+        logging.info("     >>>> framework resource (enter)")
+        response = super(RootLoggingResource, self)._respond(request, *args, **kwargs)
+        logging.info(" <<<< framework resource (exit)")
+        return response
+
+    def _call_handler(self, request, rm, handler, *args, **kwargs):
+        logging.info("%s: %s" % (handler.__class__.__name__, self.callmap.get(rm)))
+        return super(RootLoggingResource, self)._call_handler(request, rm, handler, *args, **kwargs)
+
+def requests_per_second(resource, n):
+    call = lambda: resource(Request("get"))
+    return n / benchmarks.best_of(call, repeat=1, number=n)
+
+def main(n=2000, rounds=5):
+    resource = rest_framework.Resource(EventHandler)
+    root = logging.getLogger()
+    # a handler on the root logger, so logging.info() doesn't call basicConfig
+    null = logging.StreamHandler(open('/dev/null', 'w'))
+    root.addHandler(null)
+
+    # name -> (resource, level, TRACE); "before" only makes the root logger
+    # calls, none of the new ones
+    variants = [("WARNING, before", RootLoggingResource(EventHandler), logging.WARNING, False),
+                ("WARNING, tracing on", resource, logging.WARNING, True),
+                ("WARNING, tracing off", resource, logging.WARNING, False),
+                ("INFO, tracing on", resource, logging.INFO, True)]
+    best = dict((name, 0) for name, variant, level, trace in variants)
+    try:
+        # the variants take turns, so they all see the same noise, after a
+        # warm up round that isn't counted
+        for i in range(rounds + 1):
+            for name, variant, level, trace in variants:
+                root.setLevel(level)
+                rest_framework.TRACE = trace
+                rate = requests_per_second(variant, n)
+                if i:
+                    best[name] = max(best[name], rate)
+    finally:
+        root.removeHandler(null)
+        root.setLevel(logging.WARNING)
+        rest_framework.TRACE = True
+
+    for name, variant, level, trace in variants:
+        print("%-22s %.0f requests/s" % (name + ":", best[name]))
+
+if __name__ == '__main__':
+    main()
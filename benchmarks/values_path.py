@@ -0,0 +1,28 @@
+"""
+    Constructing a QuerySet of un-massaged models from values_list(), against
+    fetching and walking model instances, at a few table sizes:
+
+        python -m benchmarks.values_path
+"""
+from __future__ import print_function
+
+import benchmarks
+from benchmarks.models import BenchEvent
+from benchmarks.pipeline import create_events
+
+import rest_framework
+
+class InstanceEmitter(rest_framework.Emitter):
+    values_path = False
+
+def main(sizes=(100, 1000, 10000)):
+    create_events(max(sizes))
+    for n in sizes:
+        events = BenchEvent.objects.filter(id__lt=n)
+        for emitter_class in (InstanceEmitter, rest_framework.Emitter):
+            # _clone() so every run goes to the database
+            seconds = benchmarks.best_of(lambda: emitter_class()._construct(events._clone()), number=5) / 5
+            print("%-6s %-16s %8.2fms %8.2fus/row" % (n, emitter_class.__name__, seconds * 1e3, seconds / n * 1e6))
+
+if __name__ == '__main__':
+    main()
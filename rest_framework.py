@@ -5,26 +5,453 @@
     returns in a selection of detail levels.
     By Ben Shaw, inspired by Piston - https://bitbucket.org/jespern/django-piston/wiki/Home
 """
+import base64
+import calendar
+import codecs
 import collections
 import decimal
 import datetime
+import hashlib
+import inspect
 import itertools
 import json
 import logging
+import Queue
+import re
+import struct
+import sys
+import threading
+import time
 import traceback
-
-import dateutil.parser
+import uuid
+import zlib
 
 from django.utils import datetime_safe
 from django.views.decorators.vary import vary_on_headers
 from django.conf import settings
-from django.db.models.query import QuerySet
-from django.db.models import Model
+from django.db.models.query import QuerySet, ValuesQuerySet
+from django.db.models.signals import post_delete, post_save
+from django.db.models import Model, Q
+from django.db import models
+from django.db import connections, transaction, DEFAULT_DB_ALIAS
+from django.core.exceptions import ValidationError
 from django.utils.encoding import smart_unicode
-from django.http import HttpResponse
+from django.core.urlresolvers import resolve
+from django.dispatch import Signal
+from django.http import Http404, HttpResponse, HttpResponseNotModified, QueryDict
+from django.utils.http import http_date, parse_etags, parse_http_date_safe, quote_etag
     
 from django import get_version as django_version
 
+# nothing is printed until the app configures these, see the README
+logging.getLogger('shimmer').addHandler(logging.NullHandler())
+resource_log = logging.getLogger('shimmer.resource')
+emitter_log = logging.getLogger('shimmer.emitter')
+error_log = logging.getLogger('shimmer.errors')
+
+# set to False to leave out the "(enter)"/"(exit)" messages of each phase of
+# a request altogether, whatever the logging level
+TRACE = True
+
+def _json_dumps(data):
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+
+# name -> function rendering data as compact json, every backend has to give
+# exactly the same output as the 'json' one
+json_backends = {'json': _json_dumps}
+
+def register_json_backend(name, dumps):
+    """
+        Makes a json encoder available to emitters as `json_backend = name`.
+    """
+    json_backends[name] = dumps
+
+# name -> function decoding a json document, for `Mimer.json_decoder`
+json_decoders = {'json': json.loads}
+
+def register_json_decoder(name, loads):
+    """
+        Makes a json decoder available to mimers as `json_decoder = name`.
+    """
+    json_decoders[name] = loads
+
+try:
+    import simplejson
+except ImportError:
+    pass
+else:
+    register_json_backend('simplejson', lambda data: simplejson.dumps(data, ensure_ascii=False, separators=(',', ':')))
+    register_json_decoder('simplejson', simplejson.loads)
+
+try:
+    import ujson
+except ImportError:
+    pass
+else:
+    # older versions round floats, which would change the output
+    if ujson.dumps([0.1 + 0.2, 1e20]) == json.dumps([0.1 + 0.2, 1e20], separators=(',', ':')):
+        register_json_backend('ujson', lambda data: ujson.dumps(data, ensure_ascii=False, escape_forward_slashes=False))
+    register_json_decoder('ujson', lambda data: ujson.loads(data, precise_float=True))
+
+def _msgpack_dumps(data):
+    """
+        Renders data as MessagePack, giving the same bytes as
+        msgpack.packb(data, use_bin_type=False): str and unicode are both
+        written as utf-8 strings, in the formats older decoders can read too.
+        Used when the msgpack package isn't installed.
+    """
+    out = []
+    _msgpack_pack(data, out.append)
+    return ''.join(out)
+
+def _msgpack_header(n, fix, fix_limit, code16, code32):
+    if n < fix_limit:
+        return chr(fix | n)
+    if n < 0x10000:
+        return struct.pack('>BH', code16, n)
+    return struct.pack('>BI', code32, n)
+
+def _msgpack_pack(value, write):
+    kind = type(value)
+    if kind is unicode or kind is str:
+        if kind is unicode:
+            value = value.encode('utf-8')
+        write(_msgpack_header(len(value), 0xa0, 32, 0xda, 0xdb))
+        write(value)
+    elif value is None:
+        write('\xc0')
+    elif kind is bool:
+        write('\xc3' if value else '\xc2')
+    elif kind is int or kind is long:
+        if 0 <= value < 0x80:
+            write(chr(value))
+        elif -32 <= value < 0:
+            write(struct.pack('b', value))
+        elif 0 < value < 0x100:
+            write(struct.pack('>BB', 0xcc, value))
+        elif 0 < value < 0x10000:
+            write(struct.pack('>BH', 0xcd, value))
+        elif 0 < value < 0x100000000:
+            write(struct.pack('>BI', 0xce, value))
+        elif 0 < value < 0x10000000000000000:
+            write(struct.pack('>BQ', 0xcf, value))
+        elif -0x80 <= value:
+            write(struct.pack('>Bb', 0xd0, value))
+        elif -0x8000 <= value:
+            write(struct.pack('>Bh', 0xd1, value))
+        elif -0x80000000 <= value:
+            write(struct.pack('>Bi', 0xd2, value))
+        elif -0x8000000000000000 <= value:
+            write(struct.pack('>Bq', 0xd3, value))
+        else:
+            raise OverflowError("Integer %s is too big for MessagePack." % value)
+    elif kind is float:
+        write(struct.pack('>Bd', 0xcb, value))
+    elif kind is list or kind is tuple:
+        write(_msgpack_header(len(value), 0x90, 16, 0xdc, 0xdd))
+        for item in value:
+            _msgpack_pack(item, write)
+    elif kind is dict:
+        write(_msgpack_header(len(value), 0x80, 16, 0xde, 0xdf))
+        for key, item in value.iteritems():
+            _msgpack_pack(key, write)
+            _msgpack_pack(item, write)
+    # subclasses, eg. an OrderedDict
+    elif isinstance(value, basestring):
+        _msgpack_pack(unicode(value) if isinstance(value, unicode) else str(value), write)
+    elif isinstance(value, (int, long)):
+        _msgpack_pack(long(value), write)
+    elif isinstance(value, float):
+        _msgpack_pack(float(value), write)
+    elif isinstance(value, (list, tuple)):
+        _msgpack_pack(list(value), write)
+    elif isinstance(value, dict):
+        _msgpack_pack(dict(value), write)
+    else:
+        raise TypeError("%r can't be rendered as MessagePack." % (value,))
+
+try:
+    import msgpack
+except ImportError:
+    msgpack_dumps = _msgpack_dumps
+else:
+    msgpack_dumps = lambda data: msgpack.packb(data, use_bin_type=False)
+
+JSON_MEDIA_TYPE = 'application/json'
+
+# media type -> (content type, function rendering data as bytes), for the
+# formats besides json a Resource can respond in, see `Resource.media_types`
+renderers = {}
+
+def register_renderer(media_type, dumps, content_type=None):
+    """
+        Makes a format available to resources as one of their `media_types`.
+    """
+    renderers[media_type] = (content_type or media_type, dumps)
+
+register_renderer('application/x-msgpack', msgpack_dumps)
+register_renderer('application/msgpack', msgpack_dumps)
+
+def parse_accept(value):
+    """
+        Parses an Accept header like "application/x-msgpack, */*;q=0.5" into
+        [('application/x-msgpack', 1.0), ('*/*', 0.5)], or an Accept-Encoding
+        header like "gzip, br;q=0.5" into [('gzip', 1.0), ('br', 0.5)].
+    """
+    ranges = []
+    for part in value.split(','):
+        params = part.split(';')
+        media_range = params[0].strip().lower()
+        if not media_range:
+            continue
+        quality = 1.0
+        for param in params[1:]:
+            name, _, param_value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(param_value)
+                except ValueError:
+                    quality = 0.0
+        ranges.append((media_range, quality))
+    return ranges
+
+def best_media_type(accept, media_types):
+    """
+        The first of `media_types` with the highest quality in an Accept
+        header, or None if none of them are acceptable. The quality of each
+        comes from the most specific range matching it, eg. "application/json"
+        before "application/*" before "*/*". Without a header, the first.
+    """
+    if not accept:
+        return media_types[0]
+    ranges = parse_accept(accept)
+    best, best_quality = None, 0
+    for media_type in media_types:
+        matches = (media_type, media_type.split('/')[0] + '/*', '*/*')
+        quality, specificity = None, len(matches)
+        for media_range, range_quality in ranges:
+            if media_range in matches and matches.index(media_range) < specificity:
+                quality, specificity = range_quality, matches.index(media_range)
+        if quality is not None and quality > best_quality:
+            best, best_quality = media_type, quality
+    return best
+
+class _BrotliCompressor(object):
+    """
+        Gives brotli's Compressor the interface of zlib's compress objects.
+    """
+    def __init__(self, level):
+        self._compressor = brotli.Compressor(quality=level)
+    
+    def compress(self, data):
+        return self._compressor.process(data)
+    
+    def flush(self, mode=zlib.Z_FINISH):
+        if mode == zlib.Z_FINISH:
+            return self._compressor.finish()
+        return self._compressor.flush()
+
+# content coding -> function taking a compression level and returning an
+# object with `compress(data)` and `flush(mode)`, like zlib.compressobj
+compressors = {
+    # without a timestamp, so the same body is always compressed the same
+    'gzip': lambda level: zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS),
+    # zlib's format, which is what HTTP calls deflate
+    'deflate': lambda level: zlib.compressobj(level),
+}
+
+try:
+    import brotli
+except ImportError:
+    pass
+else:
+    compressors['br'] = lambda level: _BrotliCompressor(level)
+
+def best_encoding(accept_encoding, encodings):
+    """
+        The first of `encodings` with the highest quality in an
+        Accept-Encoding header, or None if the response shouldn't be
+        compressed.
+    """
+    if not accept_encoding:
+        return None
+    qualities = dict(parse_accept(accept_encoding))
+    best, best_quality = None, 0
+    for encoding in encodings:
+        quality = qualities.get(encoding, qualities.get('*', 0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+def compress_chunks(chunks, compressor):
+    """
+        Compresses a streamed body as it goes, flushing after each chunk so
+        the client can start decoding it straight away.
+    """
+    for chunk in chunks:
+        if isinstance(chunk, unicode):
+            chunk = chunk.encode('utf-8')
+        compressed = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if compressed:
+            yield compressed
+    yield compressor.flush(zlib.Z_FINISH)
+
+def parse_fields(value):
+    """
+        Parses a `fields` parameter like "id,name,location(name,lat)" into
+        {'id': None, 'name': None, 'location': {'name': None, 'lat': None}}.
+        Returns None if it is empty.
+    """
+    tokens = re.findall(r'[^,()\s]+|[,()]', value)
+    if not tokens:
+        return None
+    
+    def parse(i):
+        fields = {}
+        while True:
+            if i >= len(tokens) or tokens[i] in ',()':
+                raise InvalidParameter("fields", value=value, fix="eg. fields=id,name,location(name,lat)")
+            name, i = tokens[i], i + 1
+            fields[name] = None
+            if i < len(tokens) and tokens[i] == '(':
+                fields[name], i = parse(i + 1)
+                if i >= len(tokens) or tokens[i] != ')':
+                    raise InvalidParameter("fields", value=value, fix="eg. fields=id,name,location(name,lat)")
+                i += 1
+            if i < len(tokens) and tokens[i] == ',':
+                i += 1
+            else:
+                return fields, i
+    
+    fields, i = parse(0)
+    if i != len(tokens):
+        raise InvalidParameter("fields", value=value, fix="eg. fields=id,name,location(name,lat)")
+    return fields
+
+def project(data, projection):
+    """
+        Keeps only the fields in `projection` of constructed data, a dict or
+        list of dicts.
+    """
+    if isinstance(data, dict):
+        ret = {}
+        for field, nested in projection.iteritems():
+            if field in data:
+                ret[field] = data[field] if nested is None else project(data[field], nested)
+        return ret
+    if isinstance(data, list):
+        return [project(item, projection) for item in data]
+    return data
+
+# returned by `Emitter.construct` as they are
+JSON_NATIVE_TYPES = frozenset([str, unicode, int, long, float, bool, type(None)])
+
+def wants_pretty(request, pretty=None):
+    """
+        Whether to indent json output: `pretty` if it is set, otherwise whether
+        the request asked for it with ?pretty=1, otherwise if DEBUG is on.
+    """
+    if pretty is not None:
+        return pretty
+    if request is not None:
+        value = request.REQUEST.get('pretty')
+        if value is not None:
+            return value not in ('', '0', 'false')
+    return settings.DEBUG
+
+def keyset_ordering(queryset):
+    """
+        What `queryset` is ordered by, as (name, field, descending), ending
+        with the pk so the order is stable. Only the model's own fields can
+        be paged by, and they shouldn't be null.
+    """
+    opts = queryset.model._meta
+    query = queryset.query
+    # extra(order_by=...) takes the place of the rest of the ordering
+    names = (query.extra_order_by or query.order_by
+             or (query.default_ordering and opts.ordering) or [])
+    fields = {'pk': opts.pk}
+    for field in opts.fields:
+        fields[field.name] = fields[field.attname] = field
+    
+    ordering = []
+    for name in names:
+        descending = name.startswith('-')
+        name = name.lstrip('-')
+        field = fields.get(name)
+        if field is None or (field.rel is not None and not field.primary_key and name != field.attname):
+            raise ValueError("Can't page by %r, order by the model's own fields" % name)
+        ordering.append((name, field, descending))
+    if not any(field.primary_key for name, field, descending in ordering):
+        ordering.append(('pk', opts.pk, False))
+    return ordering
+
+def keyset_filter(ordering, values):
+    """
+        The Q for the rows after the one with `values` for `ordering`.
+    """
+    after = None
+    for i, ((name, field, descending), value) in enumerate(zip(ordering, values)):
+        q = Q(**{'%s__%s' % (name, 'lt' if descending else 'gt'): value})
+        for (previous, f, d), previous_value in zip(ordering[:i], values[:i]):
+            q &= Q(**{previous: previous_value})
+        after = q if after is None else after | q
+    return after
+
+def encode_cursor(values):
+    """
+        An opaque cursor for the row with the ordering values `values`.
+    """
+    values = [v if type(v) in JSON_NATIVE_TYPES else unicode(v) for v in values]
+    return base64.urlsafe_b64encode(json.dumps(values, separators=(',', ':'))).rstrip('=')
+
+def decode_cursor(cursor, ordering):
+    """
+        The ordering values from `encode_cursor`.
+    """
+    try:
+        cursor = str(cursor)
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        if not isinstance(values, list) or len(values) != len(ordering):
+            raise ValueError(cursor)
+        return [field.to_python(value) for (name, field, descending), value in zip(ordering, values)]
+    except (TypeError, ValueError, ValidationError):
+        raise InvalidParameter("cursor", value=cursor, fix="Use the `next` cursor of the previous page")
+
+class _UTC(datetime.tzinfo):
+    def utcoffset(self, dt):
+        return datetime.timedelta(0)
+    
+    def dst(self, dt):
+        return datetime.timedelta(0)
+    
+    def tzname(self, dt):
+        return "UTC"
+    
+    def __repr__(self):
+        return "UTC"
+
+UTC = _UTC()
+
+# the default formats of emitters, which are written out without strftime
+ISO_DATETIME_FORMAT = "%Y-%m-%dT%H:%M:%S%z"
+ISO_DATE_FORMAT = "%Y-%m-%d"
+ISO_TIME_FORMAT = "%H:%M:%S"
+
+# in `Emitter._memo` for instances that have come up once
+_SEEN = object()
+
+def _copy_constructed(value):
+    """
+        Copies the dicts and lists of constructed data.
+    """
+    kind = type(value)
+    if kind is dict:
+        return dict((k, _copy_constructed(v)) for k, v in value.iteritems())
+    if kind is list:
+        return [_copy_constructed(v) for v in value]
+    return value
+
 class APIException(Exception):
     """
         Any intentional raised exception, about incorrect api usage
@@ -46,7 +473,7 @@ class NotImplemented(APIException):
         self.returnerror = {'error':{'type': "NotImplemented",
                                      'message': self.message}}
         self.status = 405
-        logging.info('api usage error: %s' % self.message)
+        error_log.info('api usage error: %s', self.message)
 
 class InvalidParameter(APIException):
     def __init__(self, parameter, value=None, override=False, fix=None):
@@ -69,7 +496,7 @@ class InvalidParameter(APIException):
         if value is not None:
             self.returnerror['error']['value'] = value
             
-        logging.debug('api usage error: %s' % self.message)        
+        error_log.debug('api usage error: %s', self.message)
         
 class InvalidPermission(APIException):
     """
@@ -78,7 +505,7 @@ class InvalidPermission(APIException):
         to entities or events
     """
     def __init__(self, perm=None):
-        logging.info('vapi error: invalid permission')
+        error_log.info('vapi error: invalid permission')
         self.message = "You do not have permission to do that."
         self.returnerror = {'error':{'type': "InvalidPermission",
                                      'message':self.message}}
@@ -97,10 +524,228 @@ class DoesNotExist(APIException):
         self.returnerror = {'error':{'type': "DoesNotExist",
                                      'message': self.message}}
         self.status = 404
-        logging.info('api usage error: %s' % self.message)
+        error_log.info('api usage error: %s', self.message)
+
+class LocalCache(object):
+    """
+        In-process cache. Entries expire after their timeout, and once
+        there are `max_entries` of them the least recently used is dropped.
+    """
+    def __init__(self, max_entries=1000):
+        self.max_entries = max_entries
+        self._entries = collections.OrderedDict() # key -> (expires, value)
+        self._lock = threading.Lock()
+    
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                expires, value = self._entries.pop(key)
+            except KeyError:
+                return default
+            if expires is not None and expires < time.time():
+                return default
+            self._entries[key] = (expires, value)
+            return value
+    
+    def set(self, key, value, timeout=None):
+        expires = None if timeout is None else time.time() + timeout
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (expires, value)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+    
+    def get_many(self, keys):
+        found = {}
+        for key in keys:
+            value = self.get(key, self)
+            if value is not self:
+                found[key] = value
+        return found
+    
+    def set_many(self, data, timeout=None):
+        for key, value in data.iteritems():
+            self.set(key, value, timeout)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+class DjangoCache(object):
+    """
+        Uses one of the caches in Django's CACHES setting.
+    """
+    def __init__(self, alias='default'):
+        from django.core.cache import get_cache
+        self.cache = get_cache(alias)
+    
+    def get(self, key, default=None):
+        return self.cache.get(key, default)
+    
+    def set(self, key, value, timeout=None):
+        self.cache.set(key, value, timeout)
+    
+    def delete(self, key):
+        self.cache.delete(key)
+    
+    def get_many(self, keys):
+        return self.cache.get_many(keys)
+    
+    def set_many(self, data, timeout=None):
+        self.cache.set_many(data, timeout)
+    
+    def clear(self):
+        self.cache.clear()
+
+class ResponseCache(object):
+    """
+        Caches rendered responses in a `LocalCache` or `DjangoCache`. Every
+        handler class has a version that is part of its keys, so all of its
+        responses can be dropped at once by `invalidate`.
+    """
+    def __init__(self, cache=None, timeout=60):
+        self.cache = LocalCache() if cache is None else cache
+        self.timeout = timeout
+    
+    def _version_key(self, handler_class):
+        return 'shimmer:version:%s.%s' % (handler_class.__module__, handler_class.__name__)
+    
+    def _version(self, handler_class):
+        version_key = self._version_key(handler_class)
+        version = self.cache.get(version_key)
+        if version is None:
+            # never reuse a version, in case the old one was evicted
+            version = uuid.uuid4().hex
+            self.cache.set(version_key, version)
+        return version
+    
+    def key(self, handler_class, parts):
+        """
+            Returns the key for the response of `handler_class`, identified
+            by `parts`.
+        """
+        digest = hashlib.md5(repr(parts)).hexdigest()
+        return 'shimmer:response:%s:%s' % (self._version(handler_class), digest)
+    
+    def get(self, key):
+        return self.cache.get(key)
+    
+    def set(self, key, response, timeout=None):
+        self.cache.set(key, response, self.timeout if timeout is None else timeout)
+    
+    def invalidate(self, handler_class):
+        """
+            Drops every cached response of `handler_class`.
+        """
+        self.cache.delete(self._version_key(handler_class))
+
+# sent with the pks of the instances of `sender` that `BulkHandler` has
+# changed with `QuerySet.update()`, which doesn't send post_save
+bulk_updated = Signal(providing_args=['pks', 'using'])
+
+class EntityCache(object):
+    """
+        Read-through cache of the instances of `model` by pk, in a
+        `LocalCache` or `DjangoCache`, for manips that look up the same
+        instances on every request:
+        
+            entity_caches = {'locations': EntityCache(Location)}
+            
+            def get_locations(self):
+                self.data['locations'] = self.cached_in_bulk('locations')
+        
+        Only the ids that aren't cached are looked up, with one `in_bulk`.
+        Entries are dropped when their instance is saved or deleted, or
+        updated by a `BulkHandler`, but not by other `QuerySet.update()`s. The
+        instances in a `LocalCache` are shared, so don't change them.
+    """
+    def __init__(self, model, cache=None, timeout=300, queryset=None):
+        self.model = model
+        self.cache = LocalCache() if cache is None else cache
+        self.timeout = timeout
+        self.queryset = model._default_manager.all() if queryset is None else queryset
+        self.hits = self.misses = 0
+        self._lock = threading.Lock()
+        self._prefix = 'shimmer:entity:%s.%s:' % (model._meta.app_label, model.__name__)
+        post_save.connect(self._invalidate, sender=model)
+        post_delete.connect(self._invalidate, sender=model)
+        bulk_updated.connect(self._invalidate_bulk, sender=model)
+    
+    def _key(self, pk):
+        return '%s%s' % (self._prefix, pk)
+    
+    def in_bulk(self, ids):
+        """
+            Returns {id: instance} like `QuerySet.in_bulk`.
+        """
+        keys = dict((self._key(pk), pk) for pk in ids)
+        cached = self.cache.get_many(keys.keys())
+        found = dict((keys[key], instance) for key, instance in cached.iteritems())
+        missing = [pk for key, pk in keys.iteritems() if key not in cached]
+        if missing:
+            fetched = self.queryset.in_bulk(missing)
+            self.cache.set_many(dict((self._key(pk), instance) for pk, instance in fetched.iteritems()),
+                                self.timeout)
+            found.update(fetched)
+        with self._lock:
+            self.hits += len(cached)
+            self.misses += len(missing)
+        return found
+    
+    def invalidate(self, pk):
+        self.cache.delete(self._key(pk))
+    
+    def _invalidate(self, sender, instance, **kwargs):
+        self.invalidate(instance.pk)
+    
+    def _invalidate_bulk(self, sender, pks, **kwargs):
+        for pk in pks:
+            self.invalidate(pk)
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+class DecodedStream(object):
+    """
+        The items of a streamed request body, decoded as they are read. It
+        can only be iterated over once.
+    """
+    def __init__(self, items, batch_size):
+        self._items = items
+        self.batch_size = batch_size
+    
+    def __iter__(self):
+        return self._items
+    
+    def batches(self, size=None):
+        """
+            Yields lists of up to `size` items, eg. for `bulk_create`.
+        """
+        size = size or self.batch_size
+        while True:
+            batch = list(itertools.islice(self._items, size))
+            if not batch:
+                return
+            yield batch
 
 class Mimer(object):
-       
+    # the largest body in bytes that will be read, or None
+    max_body_size = None
+    # whether a JSON list body is given to the handler as a DecodedStream of
+    # its items instead of being decoded all at once. NDJSON bodies
+    # (application/x-ndjson) are always streamed.
+    streaming = False
+    # how many bytes are read at a time when streaming
+    chunk_size = 64 * 1024
+    # the default size of `DecodedStream.batches()`
+    batch_size = 1000
+    # the `json_decoders` entry used for whole bodies and NDJSON lines. The
+    # items of streamed JSON lists are always decoded with `json`.
+    json_decoder = 'json'
+    
     def translate(self, request):
         """
         Will look at the `Content-type` sent by the client, and try
@@ -111,12 +756,22 @@ class Mimer(object):
         """    
         
         request.content_type = 'application/json'
+        try:
+            self._check_size(int(request.META.get('CONTENT_LENGTH') or 0))
+        except ValueError:
+            pass
         
         try:
-            if request.raw_post_data == "":
+            if request.META.get('CONTENT_TYPE', '').split(';')[0].strip() == 'application/x-ndjson':
+                request.content_type = 'application/x-ndjson'
+                request.data = DecodedStream(self._lines(self._text(request)), self.batch_size)
+            elif self.streaming:
+                request.data = self._stream(request)
+            elif request.raw_post_data == "":
                 request.data = ""
             else:
-                request.data = json.loads(request.raw_post_data)
+                self._check_size(len(request.raw_post_data))
+                request.data = json_decoders[self.json_decoder](request.raw_post_data)
             
             # Reset both POST and PUT from request, as its
             # misleading having their presence around.
@@ -125,7 +780,351 @@ class Mimer(object):
             raise InvalidParameter("JSON")
         
         return request
+    
+    def _check_size(self, size):
+        if self.max_body_size is not None and size > self.max_body_size:
+            raise InvalidParameter("body", value=size,
+                                   fix="Send at most %s bytes at a time" % self.max_body_size)
+    
+    def _text(self, request):
+        """
+            Yields the body as unicode, `chunk_size` bytes at a time.
+        """
+        decoder = codecs.getincrementaldecoder('utf-8')()
+        read = 0
+        while True:
+            chunk = request.read(self.chunk_size)
+            read += len(chunk)
+            self._check_size(read)
+            try:
+                text = decoder.decode(chunk, final=not chunk)
+            except UnicodeDecodeError:
+                raise InvalidParameter("JSON")
+            if text:
+                yield text
+            if not chunk:
+                return
+    
+    def _loads(self, text):
+        try:
+            return json_decoders[self.json_decoder](text)
+        except (TypeError, ValueError):
+            raise InvalidParameter("JSON")
+    
+    def _lines(self, chunks):
+        buffered = u''
+        for chunk in chunks:
+            lines = (buffered + chunk).split(u'\n')
+            buffered = lines.pop()
+            for line in lines:
+                if line.strip():
+                    yield self._loads(line)
+        if buffered.strip():
+            yield self._loads(buffered)
+    
+    def _stream(self, request):
+        """
+            Reads up to the start of the body, and if it is a list returns a
+            DecodedStream of its items, otherwise decodes all of it.
+        """
+        chunks = self._text(request)
+        text = u''
+        for chunk in chunks:
+            text = (text + chunk).lstrip()
+            if text:
+                break
+        if not text:
+            return ""
+        if not text.startswith(u'['):
+            return self._loads(text + u''.join(chunks))
+        return DecodedStream(self._items(text, chunks), self.batch_size)
+    
+    def _items(self, text, chunks):
+        """
+            Yields the items of the JSON list that `text`, and then `chunks`,
+            start with.
+        """
+        decode = json.JSONDecoder().raw_decode
+        pos = 1
+        expect = 'item or end'
+        while True:
+            pos = _WHITESPACE.match(text, pos).end()
+            if pos == len(text):
+                chunk = next(chunks, None)
+                if chunk is None:
+                    if expect == 'end':
+                        return
+                    raise InvalidParameter("JSON")
+                text, pos = text[pos:] + chunk, 0
+                continue
+            
+            char = text[pos]
+            if expect == 'end':
+                raise InvalidParameter("JSON")
+            elif char == u']' and expect != 'item':
+                expect, pos = 'end', pos + 1
+            elif expect == 'separator or end':
+                if char != u',':
+                    raise InvalidParameter("JSON")
+                expect, pos = 'item', pos + 1
+            else:
+                try:
+                    item, end = decode(text, pos)
+                except ValueError:
+                    end = None
+                if end is None or end == len(text):
+                    # incomplete, or a number that might go on in the next chunk
+                    chunk = next(chunks, None)
+                    if chunk is not None:
+                        text, pos = text[pos:] + chunk, 0
+                        continue
+                    if end is None:
+                        raise InvalidParameter("JSON")
+                yield item
+                expect, pos = 'separator or end', end
+        
+class _NullTimer(object):
+    def __enter__(self):
+        pass
+    
+    def __exit__(self, *exc_info):
+        pass
+
+NULL_TIMER = _NullTimer()
+
+class _Timer(object):
+    def __init__(self, profile, phase):
+        self.profile = profile
+        self.phase = phase
+    
+    def __enter__(self):
+        self.start = time.time()
+    
+    def __exit__(self, *exc_info):
+        self.profile.add(self.phase, time.time() - self.start)
+
+class Profile(object):
+    """
+        The timings of the phases of one request, in the order they finished,
+        and counts of what was done along the way.
+    """
+    def __init__(self):
+        self.timings = []
+        self.counts = collections.defaultdict(int)
+        self._lock = threading.Lock()
+    
+    def timer(self, phase):
+        """
+            Returns a context manager that times `phase`.
+        """
+        return _Timer(self, phase)
+    
+    def add(self, phase, seconds):
+        with self._lock:
+            self.timings.append((phase, seconds))
+    
+    def count(self, name, n=1):
+        with self._lock:
+            self.counts[name] += n
+
+class Metrics(object):
+    """
+        Where a Resource sends the timings and counts of each request, in the
+        style of statsd. Subclass it to send them somewhere.
+    """
+    def incr(self, name, count=1):
+        pass
+    
+    def timing(self, name, seconds):
+        pass
+    
+    def histogram(self, name, value):
+        pass
+
+class StatsdMetrics(Metrics):
+    """
+        Sends the metrics to a statsd client.
+    """
+    def __init__(self, client):
+        self.client = client
+    
+    def incr(self, name, count=1):
+        self.client.incr(name, count)
+    
+    def timing(self, name, seconds):
+        self.client.timing(name, int(seconds * 1000))
+    
+    def histogram(self, name, value):
+        self.client.timing(name, value)
+
+class MemoryMetrics(Metrics):
+    """
+        Keeps the metrics in memory, eg. for tests.
+    """
+    def __init__(self):
+        self.counters = collections.defaultdict(int)
+        self.timings = collections.defaultdict(list)
+        self.histograms = collections.defaultdict(list)
+        self._lock = threading.Lock()
+    
+    def incr(self, name, count=1):
+        with self._lock:
+            self.counters[name] += count
+    
+    def timing(self, name, seconds):
+        with self._lock:
+            self.timings[name].append(seconds)
+    
+    def histogram(self, name, value):
+        with self._lock:
+            self.histograms[name].append(value)
+
+class ManipData(collections.defaultdict):
+    """
+        `Emitter.data` when the manips run on several threads, so two manips
+        creating the same label at once don't lose each others writes.
+    """
+    def __init__(self):
+        super(ManipData, self).__init__(dict)
+        self._lock = threading.Lock()
+    
+    def __missing__(self, key):
+        with self._lock:
+            if key in self:
+                return self[key]
+            return super(ManipData, self).__missing__(key)
+
+try:
+    from gevent import monkey as gevent_monkey
+except ImportError:
+    gevent_monkey = None
+
+def cooperative():
+    """
+        Whether gevent has patched threading, so threads are greenlets and a
+        request waiting on the database or a cache lets the others run.
+    """
+    return gevent_monkey is not None and gevent_monkey.is_module_patched('threading')
+
+# raises (type, value, traceback) from sys.exc_info() again, keeping where it
+# was first raised. Written with exec as it is a syntax error to python 3
+exec("def _reraise(exc_info):\n    raise exc_info[0], exc_info[1], exc_info[2]\n")
+
+class ManipRunner(object):
+    """
+        Runs manips on a pool of threads. Manips are independent of each
+        other unless `dependencies` says otherwise ({manip: [manips it needs]}),
+        in which case a manip is only started once everything it needs has
+        finished. Each thread gets its own database connections, which are
+        closed when it is done.
+    """
+    def __init__(self, manips, dependencies=None, workers=4, count_queries=False, profile=None):
+        self.manips = list(manips)
+        self.dependencies = dependencies or {}
+        self.workers = workers
+        self.count_queries = count_queries
+        self.profile = profile
+        self.queries = 0
+        self._lock = threading.Lock()
+    
+    def _schedule(self):
+        """
+            Returns how many manips each manip is waiting on, and which manips
+            are waiting on each manip.
+        """
+        waiting = {}
+        dependents = collections.defaultdict(list)
+        for manip in self.manips:
+            needs = self.dependencies.get(manip, ())
+            for need in needs:
+                if need not in self.manips:
+                    raise ValueError("%r depends on %r, which is not a manip." % (manip, need))
+                dependents[need].append(manip)
+            waiting[manip] = len(needs)
+        
+        # make sure everything can actually run
+        left = dict(waiting)
+        ready = [manip for manip in self.manips if left[manip] == 0]
+        finished = 0
+        while ready:
+            finished += 1
+            for dependent in dependents[ready.pop()]:
+                left[dependent] -= 1
+                if left[dependent] == 0:
+                    ready.append(dependent)
+        if finished != len(self.manips):
+            raise ValueError("The manip dependencies contain a cycle.")
+        
+        return waiting, dependents
+    
+    def _work(self, tasks, results):
+        if self.count_queries:
+            for conn in connections.all():
+                conn.use_debug_cursor = True
+        try:
+            while True:
+                manip = tasks.get()
+                if manip is None:
+                    return
+                try:
+                    if self.profile is None:
+                        manip()
+                    else:
+                        with self.profile.timer('manip.%s' % manip.__name__):
+                            manip()
+                except BaseException:
+                    results.put((manip, sys.exc_info()))
+                else:
+                    results.put((manip, None))
+        finally:
+            for conn in connections.all():
+                if self.count_queries:
+                    with self._lock:
+                        self.queries += len(conn.queries)
+                conn.close()
+    
+    def run(self):
+        """
+            Runs all of the manips, and raises the first exception any
+            of them raised once the running ones have finished.
+        """
+        waiting, dependents = self._schedule()
+        tasks, results = Queue.Queue(), Queue.Queue()
+        threads = [threading.Thread(target=self._work, args=(tasks, results))
+                   for i in range(min(self.workers, len(self.manips)))]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        
+        error = None
+        running = 0
+        try:
+            for manip in self.manips:
+                if waiting[manip] == 0:
+                    tasks.put(manip)
+                    running += 1
+            
+            while running:
+                manip, exc_info = results.get()
+                running -= 1
+                if exc_info is not None:
+                    if error is None:
+                        error = exc_info
+                elif error is None:
+                    for dependent in dependents[manip]:
+                        waiting[dependent] -= 1
+                        if waiting[dependent] == 0:
+                            tasks.put(dependent)
+                            running += 1
+        finally:
+            for thread in threads:
+                tasks.put(None)
+            for thread in threads:
+                thread.join()
         
+        if error is not None:
+            _reraise(error)
+
 class Emitter(object):
     """
     Super emitter. All other emitters should subclass
@@ -134,16 +1133,148 @@ class Emitter(object):
     usually the only method you want to use in your
     emitter. See below for examples.
     """
+    # (field class, converter) pairs used to build serialization plans,
+    # the first field class that matches wins.
+    field_converters = (
+        (models.DateTimeField, '_convert_datetime'),
+        (models.DateField, '_convert_date'),
+        (models.TimeField, '_convert_time'),
+        (models.DecimalField, '_convert_decimal'),
+        (models.ForeignKey, '_convert_scalar'),
+        (models.AutoField, '_convert_scalar'),
+        (models.IntegerField, '_convert_scalar'),
+        (models.FloatField, '_convert_scalar'),
+        (models.BooleanField, '_convert_scalar'),
+        (models.NullBooleanField, '_convert_scalar'),
+        (models.CharField, '_convert_text'),
+        (models.TextField, '_convert_text'),
+    )
+    
+    # field converter -> (the type it converts itself, the converter
+    # `construct` uses for that type by default)
+    field_converter_types = {
+        '_convert_datetime': (datetime.datetime, '_datetime'),
+        '_convert_date': (datetime.date, '_date'),
+        '_convert_time': (datetime.time, '_time'),
+        '_convert_decimal': (decimal.Decimal, '_decimal'),
+    }
+    
+    # (emitter class, model class, exclude_fields) -> [(attname, converter name)]
+    _plan_cache = {}
+    
+    # type -> converter (the name of a method, or a function taking the
+    # emitter and the thing) used by `construct`, see `register_converter`
+    converters = {
+        str: '_native',
+        unicode: '_native',
+        int: '_native',
+        long: '_native',
+        float: '_native',
+        bool: '_native',
+        QuerySet: '_qs',
+        list: '_list',
+        tuple: '_list',
+        dict: '_dict',
+        decimal.Decimal: '_decimal',
+        Model: '_model',
+        datetime.datetime: '_datetime',
+        datetime.date: '_date',
+        datetime.time: '_time',
+    }
+    
+    # emitter class -> {type: converter function}, filled in as `construct`
+    # comes across new types
+    _dispatch_caches = {}
+    
+    # if True, the collecting pass remembers where the massaged models are
+    # ("holes") and the second pass only calls the massagers on those,
+    # instead of constructing all of the data again.
+    single_pass = False
+    
+    # how many threads to run the manips on, 0 runs them one after another.
+    # Manips are treated as independent apart from what is declared in
+    # `manip_dependencies`.
+    manip_workers = 0
+    
+    # under gevent (see `cooperative`), run the manips all at once on
+    # greenlets unless `manip_workers` says otherwise. Like `manip_workers`,
+    # each gets its own database connection, so they can't see what the
+    # request has written in a transaction that isn't committed yet
+    gather_manips = False
+    
+    # how many rounds of collecting ids and running the manips to do. After
+    # the first round, the models that the massagers construct from
+    # `self.data` have their ids collected too, so eg. the city of an
+    # event's location can be looked up along with all the other cities.
+    collect_depth = 1
+    
+    # count the queries made while constructing into `stats`, only meant
+    # for debugging as it keeps every query made
+    count_queries = False
+    
+    # if True, QuerySets are streamed out `stream_batch_size` rows at a
+    # time rather than rendered all at once, see `stream`
+    streaming = False
+    stream_batch_size = 500
+    
+    # which of `json_backends` renders the output, and whether it is
+    # indented (None leaves it to `wants_pretty`)
+    json_backend = 'json'
+    pretty = None
+    
+    # label -> EntityCache, for manips to look up `self.ids[label]` through
+    # with `cached_in_bulk`
+    entity_caches = {}
+    
+    # if True, a model instance from the database that is in the response
+    # more than once (by model class and pk) is only constructed the first
+    # two times. The other times get a copy of what was constructed, or the
+    # same dicts if `memoize_shared`. Models whose massager depends on where the
+    # instance is in the response can be left out with `memoize_exclude`.
+    # Copying costs about as much as constructing a plain model, so this only
+    # pays for itself when the repeated models have a costly massager (see
+    # benchmarks/memoize.py) and is off unless asked for.
+    memoize = False
+    memoize_shared = False
+    memoize_exclude = frozenset()
+    
+    # if True, QuerySets of models without a massager are read with
+    # `values_list` and made straight into dicts, rather than instances that
+    # are then taken apart again, where that gives the same output
+    values_path = True
+    
     def __init__(self, request=None):
         self.request = request
         self.exclude_fields = ('active', '_state') # which fields of the models should we exclude
-        self.DATETIME_FORMAT = "%Y-%m-%dT%H:%M:%S%z"
-        self.DATE_FORMAT = "%Y-%m-%d"
-        self.TIME_FORMAT = "%H:%M:%S"
-        self.mimetype = 'application/json; charset=utf-8'
+        self.DATETIME_FORMAT = ISO_DATETIME_FORMAT
+        self.DATE_FORMAT = ISO_DATE_FORMAT
+        self.TIME_FORMAT = ISO_TIME_FORMAT
+        # the format the Resource picked from the Accept header
+        self.media_type = getattr(request, 'shimmer_media_type', JSON_MEDIA_TYPE)
+        if self.media_type == JSON_MEDIA_TYPE:
+            self.mimetype = 'application/json; charset=utf-8'
+        else:
+            self.mimetype = renderers[self.media_type][0]
         # initialise:
         self.manips = []
         self.massagers = {}
+        self.manip_dependencies = {} # {manip: [manips whose data it needs]}
+        self.manip_fields = {} # {manip: [fields it is needed for]}, see `wants`
+        self._dispatch = self._dispatch_caches.setdefault(type(self), {})
+        # set by the Resource to time the phases of the request
+        self.profile = getattr(request, 'shimmer_profile', None)
+        # which fields of the models at the top of the response the client
+        # wants, from the `fields` parameter, see `parse_fields`
+        self.projection = None
+        if request is not None:
+            self.projection = parse_fields(request.REQUEST.get('fields', ''))
+        self._projection = self.projection
+        self._holes = None
+        self._collect_level = None
+        self._depth = 0
+        self._memo = None
+        self._values_rows = {}
+        self.stats = {'rounds': 0, 'queries': None}
         try:
             self.setup()
         except AttributeError:
@@ -153,89 +1284,543 @@ class Emitter(object):
     def django_user(self):
         if self.request is not None:
             return self.request.user
+    
+    @property
+    def exclude_fields(self):
+        return self._exclude_fields
+    
+    @exclude_fields.setter
+    def exclude_fields(self, value):
+        # the plans depend on which fields are excluded, so drop them
+        self._exclude_fields = tuple(value)
+        self._plans = {}
+        self._projected_plans = {}
+    
+    def wants(self, field):
+        """
+        Whether the client wants `field` of the models at the top of the
+        response (see `projection`). Massagers can use it to skip adding
+        fields that would be thrown away.
+        """
+        return self.projection is None or field in self.projection
               
     def construct(self, thing):
         """
         Dispatch, all types are routed through here.
         """
-        ret = None
-        if isinstance(thing, str):
-            ret = thing
-        elif isinstance(thing, QuerySet):
-            ret = self._qs(thing)
-        elif isinstance(thing, (tuple, list)):
-            ret = self._list(thing)
-        elif isinstance(thing, dict):
-            ret = self._dict(thing)
-        elif isinstance(thing, decimal.Decimal):
-            ret = str(thing)
-        elif isinstance(thing, Model):
-            ret = self._model(thing)
-        elif isinstance(thing, datetime.datetime):
-            o2 = thing.replace(tzinfo=dateutil.tz.tzutc())
-            return datetime.datetime.strftime(o2, self.DATETIME_FORMAT)
-        elif isinstance(thing, datetime.date):
-            d = datetime_safe.new_date(thing)
-            return d.strftime(self.DATE_FORMAT)
-        elif isinstance(thing, datetime.time):
-            return thing.strftime(self.TIME_FORMAT)
-        else:
-            ret = smart_unicode(thing, strings_only=True)
-
-        return ret
+        kind = type(thing)
+        if kind in JSON_NATIVE_TYPES:
+            return thing
+        try:
+            convert = self._dispatch[kind]
+        except KeyError:
+            convert = self._converter_for(kind)
+        return convert(self, thing)
     
-    def _model(self, data):
+    def _converter_for(self, kind):
         """
-        Models.
+        Works out which of the `converters` registered with this emitter class
+        (or the classes it inherits from) to use for `kind`, going through its
+        base classes if it has no converter of its own, and remembers it.
         """
-        #logging.debug("in _model")
-        ret = { }
-
-        for f in data._meta.fields:
-                #logging.debug(f.attname)
-                if f.attname not in self.exclude_fields:
-                    ret[f.attname] = self.construct(getattr(data, f.attname))
-                  
-        # massage the data depending on what model it is
-        if type(data) in self.massagers:
-            ret = self.massagers[type(data)](ret, data) 
+        converters = {}
+        for klass in reversed(type(self).__mro__):
+            converters.update(klass.__dict__.get('converters', {}))
         
+        convert = '_unicode'
+        for base in inspect.getmro(kind):
+            if base in converters:
+                convert = converters[base]
+                break
+        if isinstance(convert, basestring):
+            convert = getattr(type(self), convert).__func__
         
-        return ret
-        
-    def _qs(self, data):
+        self._dispatch[kind] = convert
+        return convert
+    
+    @classmethod
+    def register_converter(cls, kind, convert):
         """
-        Querysets.
+        Makes `construct` use `convert(emitter, thing)` for things of type
+        `kind` or its subclasses, for this emitter class and its subclasses.
+        `convert` can also be the name of a method of the emitter. The
+        `JSON_NATIVE_TYPES` are always returned as they are.
         """
-        return [ self.construct(v) for v in data]
-            
-    def _list(self, data):
+        if 'converters' not in cls.__dict__:
+            cls.converters = {}
+        cls.converters[kind] = convert
+        for dispatch in Emitter._dispatch_caches.values():
+            dispatch.clear()
+        Emitter._plan_cache.clear()
+    
+    def _native(self, data):
+        """
+        Things json can already represent.
+        """
+        return data
+    
+    def _unicode(self, data):
+        """
+        Anything else.
+        """
+        return smart_unicode(data, strings_only=True)
+    
+    def _model(self, data):
+        """
+        Models.
+        """
+        memo = self._memo
+        # only instances loaded from the database are the same if their pks are
+        if (memo is None or self.collecting or data._state.adding
+                or type(data) in self.memoize_exclude):
+            return self._construct_model(data)
+        
+        key = (type(data), data._state.db, data.pk, self._projection is not None)
+        ret = memo.get(key)
+        if ret is None:
+            # most instances only come up once, so nothing is kept for them
+            # until they come up again
+            memo[key] = _SEEN
+            return self._construct_model(data)
+        if ret is _SEEN:
+            ret = self._construct_model(data)
+            memo[key] = ret if self.memoize_shared else _copy_constructed(ret)
+            return ret
+        if self.profile is not None:
+            self.profile.count('memoized')
+        return ret if self.memoize_shared else _copy_constructed(ret)
+    
+    def _construct_model(self, data):
+        if self._projection is not None:
+            return self._projected_model(data, self._projection)
+        
+        if self.profile is not None:
+            self.profile.count('models')
+        model = type(data)
+        try:
+            plan = self._plans[model]
+        except KeyError:
+            plan = self._plan(model)
+        
+        ret = {}
+        for attname, convert in plan:
+            ret[attname] = convert(getattr(data, attname))
+                  
+        # massage the data depending on what model it is
+        massager = self.massagers.get(model)
+        if massager is not None:
+            holes = self._holes
+            if self._collect_level is not None:
+                ret = self._massage(massager, ret, data)
+            elif holes is None or not self.collecting:
+                ret = massager(ret, data)
+            else:
+                fields = dict(ret)
+                start = len(holes)
+                ret = massager(ret, data)
+                # anything the massager constructed will be built again when
+                # it is called to fill this hole, so forget those holes
+                del holes[start:]
+                # [fields, instance, massager, parent, key]
+                holes.append([fields, data, massager, None, None])
+        
+        return ret
+    
+    def _projected_model(self, data, projection):
+        """
+        Models at the top of the response, when the client has asked for
+        only some of their fields.
+        """
+        model = type(data)
+        if model not in self.massagers:
+            if self.profile is not None:
+                self.profile.count('models')
+            try:
+                plan = self._projected_plans[model]
+            except KeyError:
+                plan = self._projected_plans[model] = self._plan(model, projection)
+            ret = {}
+            for attname, convert in plan:
+                ret[attname] = convert(getattr(data, attname))
+            return ret
+        
+        # the massager may need any of the fields, so only drop them after,
+        # and anything it constructs is projected along with its output
+        self._projection = None
+        try:
+            ret = self._model(data)
+        finally:
+            self._projection = projection
+        return project(ret, projection)
+    
+    def _plan(self, model, projection=None):
+        """
+        Returns the serialization plan for a model class, an ordered list of
+        (attname, converter) for each field that is not excluded (and is in
+        `projection`, if given). Which fields are included and which converter
+        each one gets is only worked out once per emitter class and model class.
+        """
+        included = None if projection is None else frozenset(projection)
+        key = (type(self), model, self.exclude_fields, included)
+        names = self._plan_cache.get(key)
+        if names is None:
+            names = [(f.attname, self._field_converter(f))
+                     for f in model._meta.fields
+                     if f.attname not in self.exclude_fields
+                     and (included is None or f.attname in included)]
+            self._plan_cache[key] = names
+        
+        plan = [(attname, getattr(self, converter)) for attname, converter in names]
+        if projection is None:
+            self._plans[model] = plan
+        return plan
+    
+    def _field_converter(self, field):
+        """
+        Picks the converter for a field from `field_converters`. If `construct`
+        has been overridden we can't second guess it, so everything goes
+        through it, as do fields whose type has been given a converter of its
+        own (see `register_converter`).
+        """
+        if type(self).construct.__func__ is not Emitter.construct.__func__:
+            return 'construct'
+        for field_class, converter in self.field_converters:
+            if isinstance(field, field_class):
+                kind, default = self.field_converter_types.get(converter, (None, None))
+                if kind is not None and self._converter_for(kind) is not getattr(type(self), default).__func__:
+                    return 'construct'
+                return converter
+        return 'construct'
+    
+    def _convert_datetime(self, value):
+        if type(value) is datetime.datetime:
+            return self._datetime(value)
+        return self.construct(value)
+    
+    def _convert_date(self, value):
+        if type(value) is datetime.date:
+            return self._date(value)
+        return self.construct(value)
+    
+    def _convert_time(self, value):
+        if type(value) is datetime.time:
+            return self._time(value)
+        return self.construct(value)
+    
+    def _convert_decimal(self, value):
+        if type(value) is decimal.Decimal:
+            return self._decimal(value)
+        return self.construct(value)
+    
+    def _convert_scalar(self, value):
+        if type(value) in (int, long, float, bool) or value is None:
+            return value
+        return self.construct(value)
+    
+    def _convert_text(self, value):
+        if type(value) in (unicode, str) or value is None:
+            return value
+        return self.construct(value)
+    
+    def _datetime(self, data):
+        """
+        Datetimes, which are all treated as UTC.
+        """
+        if data.year >= 1900 and self.DATETIME_FORMAT is ISO_DATETIME_FORMAT:
+            return '%04d-%02d-%02dT%02d:%02d:%02d+0000' % (data.year, data.month, data.day,
+                                                          data.hour, data.minute, data.second)
+        return datetime_safe.new_datetime(data.replace(tzinfo=UTC)).strftime(self.DATETIME_FORMAT)
+    
+    def _date(self, data):
+        """
+        Dates.
+        """
+        if data.year >= 1900 and self.DATE_FORMAT is ISO_DATE_FORMAT:
+            return '%04d-%02d-%02d' % (data.year, data.month, data.day)
+        return datetime_safe.new_date(data).strftime(self.DATE_FORMAT)
+    
+    def _time(self, data):
+        """
+        Times.
+        """
+        if self.TIME_FORMAT is ISO_TIME_FORMAT:
+            return '%02d:%02d:%02d' % (data.hour, data.minute, data.second)
+        return data.strftime(self.TIME_FORMAT)
+    
+    def _decimal(self, data):
+        """
+        Decimals.
+        """
+        return str(data)
+        
+    def _qs(self, data):
+        """
+        Querysets.
+        """
+        if self.values_path and self._can_use_values(data):
+            return self._qs_values(data)
+        if self._projection is not None and data.model not in self.massagers:
+            data = self._project_queryset(data, self._projection)
+        if self._holes is not None:
+            return self._sequence_with_holes(data)
+        return [ self.construct(v) for v in data]
+            
+    def _list(self, data):
         """
         Lists.
         """
+        if self._holes is not None:
+            return self._sequence_with_holes(data)
         return [ self.construct(v) for v in data]
         
     def _dict(self, data):
         """
         Dictionaries.
         """
-        #logging.info([k for k in data])
+        if self._holes is not None:
+            ret = {}
+            for k, v in data.iteritems():
+                ret[k] = self.construct(v)
+                self._hole_slot(v, ret, k)
+            return ret
         return {k:self.construct(v) for k, v in data.iteritems()}
     
+    def _can_use_values(self, data):
+        """
+        Whether constructing `data` from `values_list` gives exactly what
+        constructing its instances would.
+        """
+        model = data.model
+        if (type(data) is not QuerySet or model in self.massagers
+                or data._result_cache is not None
+                or data.query.aggregate_select or data.query.extra_select):
+            return False
+        # the instances have to be constructed by the plans, and with nothing
+        # on the class (eg. a descriptor) in the way of their fields
+        convert = self._dispatch.get(model) or self._converter_for(model)
+        if (convert is not Emitter._model.__func__
+                or type(self)._construct_model.__func__ is not Emitter._construct_model.__func__
+                or type(self)._projected_model.__func__ is not Emitter._projected_model.__func__):
+            return False
+        for field in model._meta.fields:
+            for klass in model.__mro__:
+                if field.attname in klass.__dict__:
+                    return False
+        return True
+    
+    def _qs_values(self, data):
+        """
+        Querysets of models without massagers, from their values.
+        """
+        # the second pass gets what the first one made
+        seen = self._values_rows.get(id(data))
+        if seen is not None and seen[0] is data:
+            return seen[1]
+        
+        model = data.model
+        projection = self._projection
+        if projection is None:
+            plan = self._plans.get(model) or self._plan(model)
+        else:
+            plan = self._projected_plans.get(model)
+            if plan is None:
+                plan = self._projected_plans[model] = self._plan(model, projection)
+        names = [attname for attname, convert in plan]
+        ret = [{name: convert(value) for (name, convert), value in zip(plan, row)}
+               for row in data.values_list(*names)]
+        if self.profile is not None:
+            self.profile.count('models', len(ret))
+        self._values_rows[id(data)] = (data, ret)
+        return ret
+    
+    def _sequence_with_holes(self, data):
+        ret = []
+        for v in data:
+            ret.append(self.construct(v))
+            self._hole_slot(v, ret, len(ret) - 1)
+        return ret
+    
+    def _hole_slot(self, value, parent, key):
+        """
+            If `value` was a massaged model, remember where its output
+            was put so the hole can be filled in later.
+        """
+        holes = self._holes
+        if holes and holes[-1][1] is value and holes[-1][3] is None:
+            holes[-1][3] = parent
+            holes[-1][4] = key
+    
+    def _reachable_holes(self, holes, data):
+        """
+            Returns the holes if we know where all of them go, otherwise None
+            and the second pass is done the long way.
+        """
+        if holes is None:
+            return None
+        for fields, instance, massager, parent, key in holes:
+            if parent is None and instance is not data:
+                return None
+        return holes
+    
+    def _project_queryset(self, data, projection):
+        """
+        Only loads the fields the client asked for.
+        """
+        if isinstance(data, ValuesQuerySet) or data.query.deferred_loading[0]:
+            return data
+        names = [f.name for f in data.model._meta.fields
+                 if f.attname in projection and f.attname not in self.exclude_fields]
+        if not names:
+            return data
+        return data.only(*names)
+    
+    def _fill_holes(self, pre_construct_data, holes):
+        """
+            Second pass for `single_pass` emitters, calls the massagers again
+            for only the holes left by the collecting pass.
+        """
+        ret = pre_construct_data
+        projection = self._projection
+        for fields, instance, massager, parent, key in holes:
+            value = massager(fields, instance)
+            if projection is not None:
+                # holes are always at the top of the response
+                value = project(value, projection)
+            if parent is None:
+                ret = value
+            else:
+                parent[key] = value
+        return ret
+    
+    def _massage(self, massager, model_dict, instance):
+        """
+            Calls a massager while collecting nested ids, the massagers of
+            models nested `_collect_level` deep or deeper are collecting.
+        """
+        depth, collecting = self._depth, self.collecting
+        self.collecting = depth >= self._collect_level
+        self._depth = depth + 1
+        try:
+            return massager(model_dict, instance)
+        finally:
+            self._depth, self.collecting = depth, collecting
+    
+    def _collect_nested(self, data, holes, level):
+        """
+            Goes through the data again, with the models that the massagers
+            reach through `self.data` collecting their ids.
+        """
+        if TRACE:
+            emitter_log.debug("collecting level %s (enter)", level)
+        self._collect_level = level
+        try:
+            if holes is not None:
+                for fields, instance, massager, parent, key in holes:
+                    self._massage(massager, dict(fields), instance)
+            else:
+                self.construct(data)
+        finally:
+            self._collect_level = None
+            self.collecting = False
+        if TRACE:
+            emitter_log.debug("collecting level %s (exit)", level)
+    
     def _pre_construct(self, data):
         """
             Does a first pass through the models to collect together 
             which event ids and entity ids it needs to get the appropriate
             data for, so we can collect it in constant time.
         """
-        logging.info("pre constructing (enter)")
+        if TRACE:
+            emitter_log.info("pre constructing (enter)")
         self.ids = collections.defaultdict(set)
         self.collecting = True
+        if self.single_pass:
+            self._holes = []
         pre_construct_data = self.construct(data)
         self.collecting = False
-        logging.info("pre constructing (exit)")
+        if TRACE:
+            emitter_log.info("pre constructing (exit)")
         return pre_construct_data
         
+    def _wanted_manips(self):
+        """
+            The manips that are needed for the fields the client wants, and
+            the manips that those depend on.
+        """
+        wanted = [manip for manip in self.manips
+                  if manip not in self.manip_fields
+                  or any(self.wants(field) for field in self.manip_fields[manip])]
+        if len(wanted) == len(self.manips):
+            return wanted
+        
+        needed = list(wanted)
+        while needed:
+            for dependency in self.manip_dependencies.get(needed.pop(), ()):
+                if dependency not in wanted:
+                    wanted.append(dependency)
+                    needed.append(dependency)
+        return [manip for manip in self.manips if manip in wanted]
+    
+    def _run_manips(self):
+        """
+            Runs the manips, on `manip_workers` threads if there are any, or
+            all at once on greenlets under gevent.
+        """
+        manips = self._wanted_manips()
+        workers = self.manip_workers
+        if not workers and self.gather_manips and len(manips) > 1 and cooperative():
+            workers = len(manips)
+        if workers:
+            self.data = ManipData()
+            runner = ManipRunner(manips, self.manip_dependencies, workers,
+                                 count_queries=self.count_queries, profile=self.profile)
+            runner.run()
+            if self.count_queries:
+                self.stats['queries'] += runner.queries
+        else:
+            self.data = collections.defaultdict(dict)
+            for manip in manips:
+                if self.profile is None:
+                    manip()
+                else:
+                    with self.profile.timer('manip.%s' % manip.__name__):
+                        manip()
+        self.stats['rounds'] += 1
+    
+    def _run_manips_for(self, ids):
+        """
+            Runs the manips for just `ids`, and adds what they find to the
+            data from the earlier rounds.
+        """
+        all_ids, all_data = self.ids, self.data
+        self.ids = ids
+        try:
+            self._run_manips()
+        finally:
+            found, self.ids, self.data = self.data, all_ids, all_data
+        
+        for label, value in found.iteritems():
+            if isinstance(value, dict) and isinstance(all_data.get(label), dict):
+                all_data[label].update(value)
+            else:
+                all_data[label] = value
+    
+    def cached_in_bulk(self, label):
+        """
+            Looks up `self.ids[label]` through `entity_caches[label]`, for
+            manips.
+        """
+        return self.entity_caches[label].in_bulk(self.ids[label])
+    
+    def _new_ids(self, fetched):
+        new_ids = collections.defaultdict(set)
+        for label, ids in self.ids.iteritems():
+            new = ids - fetched.get(label, set())
+            if new:
+                new_ids[label] = new
+        return new_ids
+    
     def _construct(self, data):
         """
         Recursively serialize a lot of types, and
@@ -244,37 +1829,139 @@ class Emitter(object):
         
         Returns the data constructed.
         """
-        logging.info("overall constructing (enter)")
-            
-        pre_construct_data = self._pre_construct(data)
+        if TRACE:
+            emitter_log.info("overall constructing (enter)")
+        self.stats = {'rounds': 0, 'queries': None}
+        self._values_rows = {}
+        if not self.count_queries:
+            return self._construct_rounds(data)
+        
+        debug_cursors = [(conn, conn.use_debug_cursor) for conn in connections.all()]
+        for conn, use_debug_cursor in debug_cursors:
+            conn.use_debug_cursor = True
+        before = sum(len(conn.queries) for conn, use_debug_cursor in debug_cursors)
+        self.stats['queries'] = 0
+        try:
+            return self._construct_rounds(data)
+        finally:
+            self.stats['queries'] += sum(len(conn.queries) for conn, use_debug_cursor in debug_cursors) - before
+            for conn, use_debug_cursor in debug_cursors:
+                conn.use_debug_cursor = use_debug_cursor
+            emitter_log.debug("constructed in %(rounds)s rounds with %(queries)s queries", self.stats)
+    
+    def _timer(self, phase):
+        if self.profile is None:
+            return NULL_TIMER
+        return self.profile.timer(phase)
+    
+    def _construct_rounds(self, data):
+        with self._timer('pre_construct'):
+            pre_construct_data = self._pre_construct(data)
+        holes, self._holes = self._holes, None
+        holes = self._reachable_holes(holes, data)
+        if self.profile is not None:
+            self.profile.count('ids', sum(len(ids) for ids in self.ids.itervalues()))
         # Kickstart the seralizin'.
         
          #if it found no ids, then we can just use the pre construct data
         if any((len(ids) > 0 for label, ids in self.ids.iteritems())):
-            self.data = collections.defaultdict(dict)
-
-                      
-            for manip in self.manips:
-                manip()
+            with self._timer('manips'):
+                self._run_manips()
+            fetched = dict((label, set(ids)) for label, ids in self.ids.iteritems())
             
-            logging.debug("constructing (enter)")
-            # extend the output using the collated data we've found
-            data =  self.construct(data)
-            logging.debug("constructing (exit)")
+            # keep collecting the ids of the models reached through the data
+            # we have found, until there aren't any new ones
+            for level in range(1, self.collect_depth):
+                with self._timer('collect_nested'):
+                    self._collect_nested(data, holes, level)
+                new_ids = self._new_ids(fetched)
+                if not new_ids:
+                    break
+                with self._timer('manips'):
+                    self._run_manips_for(new_ids)
+                for label, ids in new_ids.iteritems():
+                    fetched.setdefault(label, set()).update(ids)
             
-            logging.debug("overall constructing (exit)")
+            if TRACE:
+                emitter_log.debug("constructing (enter)")
+            # extend the output using the collated data we've found
+            self._memo = {} if self.memoize else None
+            try:
+                with self._timer('construct'):
+                    if holes is not None:
+                        data = self._fill_holes(pre_construct_data, holes)
+                    else:
+                        data =  self.construct(data)
+            finally:
+                self._memo = None
+            if TRACE:
+                emitter_log.debug("constructing (exit)")
+                emitter_log.debug("overall constructing (exit)")
             return data
         else:
-            logging.debug("overall constructing (exit)")
+            if TRACE:
+                emitter_log.debug("overall constructing (exit)")
             return pre_construct_data
             
+    def dumps(self, data):
+        if wants_pretty(self.request, self.pretty):
+            return json.dumps(data, ensure_ascii=False, indent=4)
+        return json_backends[self.json_backend](data)
+    
     def render(self, data):
-        """ Implements a default JSON renderer """        
-        logging.info("render (start)")
+        """ Renders JSON, or the format the Resource picked """        
+        if TRACE:
+            emitter_log.info("render (start)")
         
-        seria = json.dumps(data, ensure_ascii=False, indent=4)
-        logging.info("rendered %s characters (end)" % len(seria))
+        with self._timer('render'):
+            if self.media_type == JSON_MEDIA_TYPE:
+                seria = self.dumps(data)
+            else:
+                seria = renderers[self.media_type][1](data)
+        if TRACE and emitter_log.isEnabledFor(logging.INFO):
+            emitter_log.info("rendered %s characters (end)", len(seria))
         return seria    
+    
+    def stream(self, data, error=None, extra=None):
+        """
+        Streaming version of `_construct` and `render` for QuerySets. Walks the
+        QuerySet with `.iterator()`, and collects, manips and constructs
+        `stream_batch_size` rows at a time, yielding the rendered JSON
+        of each batch as it goes. Other formats aren't streamed.
+        
+        Errors in the first batch are raised. After that it is too late to
+        change the status, so if `error` is given, it is called with the
+        exception and the returned error is added to the response next to
+        the data, eg {"data": [...], "error": {...}}. `extra` is added after
+        the data, eg {"data": [...], "next": "..."}.
+        """
+        if TRACE:
+            emitter_log.info("streaming (enter)")
+        rows = data.iterator() if isinstance(data, QuerySet) else iter(data)
+        chunk = '{"data":['
+        end = ''.join(',%s:%s' % (self.dumps(key), self.dumps(value))
+                      for key, value in sorted((extra or {}).items())) + '}'
+        separator = ''
+        try:
+            while True:
+                batch = list(itertools.islice(rows, self.stream_batch_size))
+                if not batch:
+                    break
+                constructed = self._construct(batch)
+                chunk += separator + ','.join(self.dumps(row) for row in constructed)
+                separator = ','
+
+                yield chunk
+                chunk = ''
+        except Exception as e:
+            if error is None or not separator:
+                raise
+            returnerror = error(e)
+            yield chunk + '],"error":' + self.dumps(returnerror['error']) + end
+        else:
+            yield chunk + ']' + end
+        if TRACE:
+            emitter_log.info("streaming (exit)")
                
 class BaseHandler(object):
     """
@@ -288,6 +1975,34 @@ class BaseHandler(object):
     """
     status = None
     
+    # set by the Resource when it caches responses, see `invalidate_cache`
+    response_cache = None
+    # seconds to cache responses for, None uses the cache's timeout
+    cache_timeout = None
+    
+    def etag(self, request, *args, **kwargs):
+        """
+        Override to return a cheap version of what `read` would return, eg. a
+        counter or the last time it changed, for the ETag. If the client has
+        the current version, the response doesn't need to be made at all.
+        """
+        return None
+    
+    def last_modified(self, request, *args, **kwargs):
+        """
+        Override to return when what `read` would return last changed, as
+        a UTC datetime, for Last-Modified and If-Modified-Since.
+        """
+        return None
+    
+    def invalidate_cache(self):
+        """
+        Drops the cached responses for this handler, call it when
+        `create`/`update`/`delete` change what `read` returns.
+        """
+        if self.response_cache is not None:
+            self.response_cache.invalidate(type(self))
+    
     def read(self, request, *args, **kwargs):
         raise NotImplemented("GET")
 
@@ -299,6 +2014,227 @@ class BaseHandler(object):
     
     def delete(self, request, *args, **kwargs):
         raise NotImplemented("DELETE")
+
+class BulkHandler(BaseHandler):
+    """
+    Writes lists of objects at once: POST a list of objects to create them,
+    PUT a list of objects with their primary keys to update them, and DELETE
+    a list of primary keys (or objects with them) to delete them. Items can
+    say which of `models` they are with a `type`, otherwise they are
+    `model`s. Primary keys go by the field's attname, eg. "id" or "code".
+    
+    The items are all checked first, then written in one transaction with a
+    few queries per model. Each item is answered in order with
+    {"status": 200, "data": ...} or {"status": 400, "error": {...}}, and the
+    invalid ones are not written.
+    """
+    model = None
+    # type -> model, for lists of more than one model
+    models = {}
+    # objects per `bulk_create` query
+    batch_size = 500
+    # the database to write to
+    using = DEFAULT_DB_ALIAS
+    
+    def clean(self, request, model, item):
+        """
+        Returns the values to write for `item`, or raises an APIException if
+        it can't be written. Override to check permissions or change values.
+        """
+        if not isinstance(item, dict):
+            raise InvalidParameter("item", value=item)
+        fields = set(field.attname for field in model._meta.fields)
+        values = {}
+        for name, value in item.iteritems():
+            if name == 'type':
+                continue
+            if name not in fields:
+                raise InvalidParameter(name, fix="choose from [%s]" % "/".join(sorted(fields)))
+            values[name] = value
+        return values
+    
+    def create(self, request, *args, **kwargs):
+        results, grouped = self._group(request, self._items(request), creating=True)
+        with transaction.commit_on_success(using=self.using):
+            for model, items in grouped.iteritems():
+                items = self._related_exist(model, items, results, creating=True)
+                instances = [instance for i, instance, values in items]
+                for start in range(0, len(instances), self.batch_size):
+                    model._default_manager.using(self.using).bulk_create(instances[start:start + self.batch_size])
+                for i, instance, values in items:
+                    results[i] = {'status': 201, 'data': instance}
+        self.invalidate_cache()
+        return results
+    
+    def update(self, request, *args, **kwargs):
+        results, grouped = self._group(request, self._items(request))
+        updated = collections.defaultdict(list) # model -> pks
+        with transaction.commit_on_success(using=self.using):
+            for model, items in grouped.iteritems():
+                manager = model._default_manager.using(self.using)
+                items = self._related_exist(model, items, results)
+                existing = self._existing(model, items, results)
+                # items setting the same values are updated together
+                same_values = collections.OrderedDict()
+                for i, instance, values in items:
+                    if instance.pk in existing:
+                        same_values.setdefault(values, []).append((i, instance.pk))
+                for values, updates in same_values.iteritems():
+                    pks = [pk for i, pk in updates]
+                    if values:
+                        manager.filter(pk__in=pks).update(**dict(values))
+                        updated[model].extend(pks)
+                    for i, pk in updates:
+                        results[i] = {'status': 200, 'data': {model._meta.pk.attname: pk}}
+        for model, pks in updated.iteritems():
+            bulk_updated.send(sender=model, pks=pks, using=self.using)
+        self.invalidate_cache()
+        return results
+    
+    def delete(self, request, *args, **kwargs):
+        results, grouped = self._group(request, self._items(request), cleaning=False)
+        with transaction.commit_on_success(using=self.using):
+            for model, items in grouped.iteritems():
+                existing = self._existing(model, items, results)
+                model._default_manager.using(self.using).filter(pk__in=existing).delete()
+                for i, instance, values in items:
+                    if instance.pk in existing:
+                        results[i] = {'status': 200, 'data': {model._meta.pk.attname: instance.pk}}
+        self.invalidate_cache()
+        return results
+    
+    def _items(self, request):
+        data = getattr(request, 'data', None)
+        if isinstance(data, DecodedStream):
+            data = list(data)
+        if not isinstance(data, list):
+            raise InvalidParameter("data", fix="Send a list of objects")
+        return data
+    
+    def _model(self, item):
+        if isinstance(item, dict) and 'type' in item:
+            try:
+                return self.models[item['type']]
+            except (KeyError, TypeError):
+                raise InvalidParameter("type", value=item['type'],
+                                       fix="choose from [%s]" % "/".join(self.models.keys()))
+        if self.model is None:
+            raise InvalidParameter("type", fix="choose from [%s]" % "/".join(self.models.keys()))
+        return self.model
+    
+    def _group(self, request, items, creating=False, cleaning=True):
+        """
+        Checks the items, returning the list of results with the errors filled
+        in, and the valid items by model as (index, instance, values). The
+        values of updates are as `_update_values` gives them.
+        """
+        results = [None] * len(items)
+        grouped = collections.OrderedDict()
+        for i, item in enumerate(items):
+            try:
+                model = self._model(item)
+                pk = model._meta.pk
+                if cleaning:
+                    values = self.clean(request, model, item)
+                elif isinstance(item, dict):
+                    values = {pk.attname: item.get(pk.attname)}
+                else:
+                    # deleting by the primary key alone
+                    values = {pk.attname: item}
+                if not creating:
+                    if values.get(pk.attname) is None:
+                        raise InvalidParameter(pk.attname)
+                    values[pk.attname] = pk.to_python(values[pk.attname])
+                instance = model(**values)
+                if cleaning:
+                    self._validate(model, instance, values, creating)
+                    values.pop(pk.attname, None)
+                if cleaning and not creating:
+                    values = self._update_values(model, instance, values)
+            except APIException as e:
+                results[i] = {'status': e.status, 'error': e.returnerror['error']}
+            except (TypeError, ValueError, ValidationError):
+                results[i] = {'status': 400, 'error': InvalidParameter("item", value=item).returnerror['error']}
+            else:
+                grouped.setdefault(model, []).append((i, instance, values))
+        return results, grouped
+    
+    def _update_values(self, model, instance, values):
+        """
+        The values to update an instance with, as sorted (name, value) pairs
+        so items setting the same ones can be updated together. `update()`
+        takes field names, eg. venue rather than venue_id.
+        """
+        names = dict((field.attname, field.name) for field in model._meta.fields)
+        values = tuple(sorted((names[name], getattr(instance, name)) for name in values))
+        # an unhashable value, eg. a list for a related field, isn't valid
+        hash(values)
+        return values
+    
+    def _validate(self, model, instance, values, creating):
+        # related objects would each be looked up, `_related_exist` checks
+        # them all at once
+        exclude = [field.name for field in model._meta.fields
+                   if field.rel is not None or field.primary_key
+                   or not (creating or field.attname in values)]
+        try:
+            instance.clean_fields(exclude=exclude)
+        except ValidationError as e:
+            name, messages = sorted(e.message_dict.items())[0]
+            raise InvalidParameter(name, value=values.get(name), fix=" ".join(messages))
+    
+    def _related_exist(self, model, items, results, creating=False):
+        """
+        The items whose foreign keys exist, with a query per foreign key,
+        answering the others with InvalidParameter. One missing object would
+        otherwise fail the whole transaction when it's committed.
+        """
+        for field in model._meta.fields:
+            if field.rel is None:
+                continue
+            related = field.rel.get_related_field()
+            keys, invalid = {}, set() # index -> key, indexes
+            for i, instance, values in items:
+                # updates only check the keys they set
+                if not creating and field.name not in dict(values):
+                    continue
+                key = getattr(instance, field.attname)
+                if key is None:
+                    continue
+                try:
+                    keys[i] = related.to_python(key)
+                    hash(keys[i])
+                except (TypeError, ValueError, ValidationError):
+                    invalid.add(i)
+            if not keys and not invalid:
+                continue
+            existing = set(field.rel.to._default_manager.using(self.using)
+                                .filter(**{'%s__in' % related.name: set(keys.values())})
+                                .values_list(related.attname, flat=True)) if keys else set()
+            kept = []
+            for item in items:
+                i, instance, values = item
+                if i in invalid or (i in keys and keys[i] not in existing):
+                    e = InvalidParameter(field.attname, value=getattr(instance, field.attname),
+                                         fix="No %s has it." % field.rel.to.__name__.lower())
+                    results[i] = {'status': e.status, 'error': e.returnerror['error']}
+                else:
+                    kept.append(item)
+            items = kept
+        return items
+    
+    def _existing(self, model, items, results):
+        """
+        The pks of `items` that exist, answering the others with DoesNotExist.
+        """
+        pks = [instance.pk for i, instance, values in items]
+        existing = set(model._default_manager.using(self.using).filter(pk__in=pks)
+                                                              .values_list('pk', flat=True))
+        for i, instance, values in items:
+            if instance.pk not in existing:
+                e = DoesNotExist(model.__name__.lower(), **{model._meta.pk.attname: instance.pk})
+                results[i] = {'status': e.status, 'error': e.returnerror['error']}
+        return existing
         
 class Resource(object):
     """
@@ -313,20 +2249,347 @@ class Resource(object):
 
     output = {'default':Emitter}
     
+    # decodes the bodies of POSTs and PUTs, subclass it to eg. stream them
+    mimer = Mimer
+    
+    # whether errors are indented, None leaves it to `wants_pretty`
+    pretty = None
+    
+    # a ResponseCache to cache the responses to GETs in, eg
+    # ResponseCache(DjangoCache('default'), timeout=300)
+    cache = None
+    
+    # whether to send an ETag made from the rendered response with GETs, if
+    # the handler doesn't give one, and answer with a 304 if it matches
+    etags = False
+    
+    # whether QuerySets returned by `read` are paged by the `limit` and `cursor`
+    # parameters, with the `next` cursor next to the data
+    paginate = False
+    page_size = 20
+    max_page_size = 100
+    
+    # a Metrics to send the timings of the phases of each request to, and
+    # whether to send them to the client in a Server-Timing header
+    metrics = None
+    server_timing = False
+    
+    # the formats responses (and errors) can be rendered in, picked by the
+    # Accept header, the first if it doesn't accept any of them
+    media_types = (JSON_MEDIA_TYPE, 'application/x-msgpack', 'application/msgpack')
+    
+    # whether to compress responses of at least `compress_min_size` bytes
+    # (and streamed ones) with the first of `encodings` the Accept-Encoding
+    # header accepts, at `compress_level` (1-9, or up to 11 for brotli)
+    compress = True
+    compress_min_size = 1024
+    compress_level = 6
+    encodings = ('br', 'gzip', 'deflate')
+    
     def __init__(self, handler):
         if not callable(handler):
             raise AttributeError("Handler not callable.")
         
-        # we get passed a class naem, create an instance of it
+        # we get passed a class naem, create an instance of it, which each
+        # request gets a copy of, see `handler_for`
         self.handler = handler()
         
         self.csrf_exempt = getattr( self.handler, 'csrf_exempt', True )
+        if self.cache is not None:
+            self.handler.response_cache = self.cache
+    
+    def handler_for(self, request):
+        """
+        The handler to handle a request with: a shallow copy of `self.handler`,
+        so what it sets on itself while handling the request, eg. its
+        `status`, can't leak into other requests being handled at the same
+        time on other threads. Anything set on `self.handler` is still shared.
+        """
+        # what copy.copy does for plain objects, without its overhead
+        handler = object.__new__(type(self.handler))
+        handler.__dict__.update(self.handler.__dict__)
+        handler.status = None
+        return handler
+    
+    def _variant(self, request, *args, **kwargs):
+        """
+        What a GET response depends on besides the handler: its arguments,
+        the output emitter and format, who is asking, and the rest of the GET
+        parameters.
+        """
+        # emitters can tailor the response to `request.user` (see
+        # `Emitter.django_user`), eg. from a session cookie
+        django_user = getattr(getattr(request, 'user', None), 'pk', None)
+        return (args, sorted(kwargs.items()),
+                request.REQUEST.get('output', 'default'),
+                getattr(request, 'shimmer_media_type', JSON_MEDIA_TYPE),
+                getattr(request, 'user_id', None), request.META.get('HTTP_AUTHORIZATION'), django_user,
+                # every value of a repeated parameter, as in ?tag=a&tag=b
+                sorted(request.GET.lists()))
+    
+    def cache_key(self, request, *args, **kwargs):
+        """
+        The key to cache the response to a GET under.
+        """
+        return self.cache.key(type(self.handler), self._variant(request, *args, **kwargs))
+    
+    def validators(self, request, *args, **kwargs):
+        """
+        Returns the ETag (unquoted) and Last-Modified (a timestamp) from the
+        handler's `etag` and `last_modified` for a GET, either can be None.
+        """
+        etag = last_modified = None
+        handler = getattr(request, 'shimmer_handler', self.handler)
+        handler_etag = getattr(handler, 'etag', None)
+        if handler_etag is not None:
+            version = handler_etag(request, *args, **kwargs)
+            if version is not None:
+                # the same version is rendered differently for each variant
+                etag = hashlib.md5(repr((version, self._variant(request, *args, **kwargs)))).hexdigest()
+        
+        handler_last_modified = getattr(handler, 'last_modified', None)
+        if handler_last_modified is not None:
+            last_modified = handler_last_modified(request, *args, **kwargs)
+            if isinstance(last_modified, datetime.datetime):
+                last_modified = calendar.timegm(last_modified.utctimetuple())
+        return etag, last_modified
+    
+    def not_modified(self, request, etag, last_modified):
+        """
+        Whether the client already has the response, going by its
+        If-None-Match and If-Modified-Since headers.
+        """
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if if_none_match and etag is not None:
+            etags = parse_etags(if_none_match)
+            return '*' in etags or etag in etags
+        
+        if_modified_since = request.META.get('HTTP_IF_MODIFIED_SINCE')
+        if if_modified_since and last_modified is not None and not if_none_match:
+            since = parse_http_date_safe(if_modified_since)
+            return since is not None and int(last_modified) <= since
+        return False
+    
+    def error(self, e):
+        """
+        Returns the error to respond with for an exception, and its status.
+        Must be called while handling the exception.
+        """
+        if isinstance(e, APIException):
+            return e.returnerror, e.status
+        
+        error_log.exception("Exception in API %s", e)
+        if settings.DEBUG:
+            return {'error':{
+                        'type':"APIError",
+                        'message':("API (Django %s) crash report:\n\n%s" % 
+                (django_version(), str(traceback.format_exc())))}}, 500
+        else:
+            return {'error':{
+                        'type':"APIError",
+                        'message':"An API error has occured, please try again later."}}, 500
+    
+    def _call_handler(self, request, rm, handler, *args, **kwargs):
+        """
+        Calls the handler's method for the HTTP method `rm`.
+        """
+        method_string = self.callmap.get(rm, None)
+        if method_string is None:
+            raise NotImplemented(rm)
+        meth = getattr(handler, method_string, False)
+        
+        # tries to call the view
+        if resource_log.isEnabledFor(logging.INFO):
+            resource_log.info("%s: %s", handler.__class__.__name__, method_string)
+        return meth(request, *args, **kwargs)
+    
+    def negotiate(self, request):
+        """
+        The media type to respond to the request in, one of `media_types`.
+        """
+        return best_media_type(request.META.get('HTTP_ACCEPT'), self.media_types) or self.media_types[0]
+    
+    def render_error(self, request, error, media_type):
+        """
+        Renders an error, returning it and its mimetype.
+        """
+        if media_type != JSON_MEDIA_TYPE:
+            mimetype, dumps = renderers[media_type]
+            return dumps(error), mimetype
+        if wants_pretty(request, self.pretty):
+            return json.dumps(error, indent=4), "application/json"
+        return json.dumps(error, separators=(',', ':')), "application/json"
+    
+    def accepted_encoding(self, request):
+        """
+        The content coding big responses to the request are compressed with,
+        or None.
+        """
+        if not self.compress:
+            return None
+        return best_encoding(request.META.get('HTTP_ACCEPT_ENCODING'),
+                             [encoding for encoding in self.encodings if encoding in compressors])
+    
+    def weak_etag(self, request):
+        """
+        Whether the ETag is sent weak: whenever the response could be
+        compressed, as a compressed body isn't byte for byte the one the ETag
+        is for. It doesn't go by whether this one is, so a 304 made before
+        the body agrees with the 200.
+        """
+        return self.accepted_encoding(request) is not None
+    
+    def content_encoding(self, request, stream):
+        """
+        The content coding to compress a rendered response with, or None.
+        """
+        if isinstance(stream, basestring) and len(stream) < self.compress_min_size:
+            return None
+        return self.accepted_encoding(request)
+    
+    def compressed(self, stream, encoding):
+        """
+        Compresses a rendered response, a string or an iterator of chunks.
+        """
+        compressor = compressors[encoding](self.compress_level)
+        if isinstance(stream, basestring):
+            if isinstance(stream, unicode):
+                stream = stream.encode('utf-8')
+            return compressor.compress(stream) + compressor.flush(zlib.Z_FINISH)
+        return compress_chunks(stream, compressor)
+    
+    def _emitter(self, request):
+        """
+        The emitter the request asked for with `output`.
+        """
+        output_format = request.REQUEST.get('output','default')
+        try:
+            output_emitter = self.output[output_format]
+        except KeyError:
+            raise InvalidParameter("emission type", value=output_format, fix="choose from [%s]" % "/".join(self.output.keys()))
+        
+        return output_emitter(request=request)# give request so we can lazily load the user only if necessary
+    
+    def _handle(self, request, rm, handler, *args, **kwargs):
+        """
+        Calls the handler and constructs and renders what it returns,
+        returning the rendered response, its mimetype and status.
+        """
+        profile = getattr(request, 'shimmer_profile', None)
+        # Translate nested datastructs into `request.data` here.
+        if rm in ('POST', 'PUT') or (rm == 'DELETE' and request.raw_post_data):
+            mimer = self.mimer()
+            with self._timer(profile, 'mimer'):
+                mimer.translate(request)
+        
+        with self._timer(profile, 'handler'):
+            result = self._call_handler(request, rm, handler, *args, **kwargs)
+        
+        result, extra = self._paged(request, rm, result)
+        
+        # construct the response using the appropriate detail then render to json
+        emitter = self._emitter(request)
+        mimetype = emitter.mimetype
+
+        if (emitter.streaming and isinstance(result, QuerySet)
+                and emitter.media_type == JSON_MEDIA_TYPE):
+            # do the first batch now so we can still give a proper error
+            chunks = emitter.stream(result, error=lambda e: self.error(e)[0], extra=extra)
+            stream = itertools.chain([next(chunks)], chunks)
+        else:
+            construct = emitter._construct(data=result)
+            extra['data'] = construct
+            stream = emitter.render(extra)
+        
+        if handler.status is None:
+            status = 200
+        else:
+            status = handler.status
+        
+        if isinstance(stream, unicode):
+            stream = stream.encode('utf-8')
+        if profile is not None and isinstance(stream, str):
+            profile.count('bytes', len(stream))
+        return stream, mimetype, status
+    
+    def _paged(self, request, rm, result):
+        """
+        Pages what `read` returned if the resource is paginated, returning
+        the page and what to add next to the data, eg. the `next` cursor.
+        """
+        extra = {}
+        if rm == 'GET' and self.paginate and isinstance(result, QuerySet):
+            result, extra['next'] = self.page(request, result)
+        return result, extra
     
-    @vary_on_headers('Authorization')
+    def page(self, request, queryset):
+        """
+        Returns the page of `queryset` the request asked for with `limit` and
+        `cursor`, and the cursor of the next page, or None if it is the last.
+        The rows are found by their ordering values, not with an OFFSET, so
+        every page is as quick to get.
+        """
+        limit = request.REQUEST.get('limit', self.page_size)
+        try:
+            limit = int(limit)
+        except (TypeError, ValueError):
+            limit = None
+        if limit is None or not 0 < limit <= self.max_page_size:
+            raise InvalidParameter("limit", value=request.REQUEST.get('limit'),
+                                   fix="choose from 1 to %s" % self.max_page_size)
+        
+        if not queryset.query.can_filter():
+            # a sliced QuerySet can't be filtered or reordered, the handler has
+            # already picked the rows
+            resource_log.warning("%s is sliced, not paging it", queryset.model.__name__)
+            return queryset, None
+        
+        try:
+            ordering = keyset_ordering(queryset)
+        except ValueError as e:
+            # eg. order_by('?'), or by a related model's fields
+            resource_log.warning("%s, paging %s by pk instead", e, queryset.model.__name__)
+            ordering = [('pk', queryset.model._meta.pk, False)]
+        queryset = queryset.order_by(*[('-' if descending else '') + name
+                                       for name, field, descending in ordering])
+        cursor = request.REQUEST.get('cursor')
+        if cursor:
+            queryset = queryset.filter(keyset_filter(ordering, decode_cursor(cursor, ordering)))
+        
+        # only the ordering values of one more row than the page, to tell if
+        # there is a next page
+        keys = list(queryset.values_list(*[name for name, field, descending in ordering])[:limit + 1])
+        next_cursor = encode_cursor(keys[limit - 1]) if len(keys) > limit else None
+        return queryset[:limit], next_cursor
+    
+    def _timer(self, profile, phase):
+        if profile is None:
+            return NULL_TIMER
+        return profile.timer(phase)
+    
+    def report(self, request, response, profile):
+        """
+        Sends the timings and counts of a request to `metrics`, and adds the
+        Server-Timing header.
+        """
+        if self.metrics is not None:
+            name = 'shimmer.%s' % self.handler.__class__.__name__
+            self.metrics.incr('%s.status.%s' % (name, response.status_code))
+            for phase, seconds in profile.timings:
+                self.metrics.timing('%s.%s' % (name, phase), seconds)
+            for count, value in profile.counts.iteritems():
+                self.metrics.histogram('%s.%s' % (name, count), value)
+        
+        if self.server_timing:
+            response['Server-Timing'] = ', '.join('%s;dur=%.2f' % (phase, seconds * 1000)
+                                                  for phase, seconds in profile.timings)
+    
+    @vary_on_headers('Authorization', 'Accept', 'Accept-Encoding')
     def __call__(self, request, *args, **kwargs):
         """
         NB: Sends a `Vary` header so we don't cache requests
-        that are different (OAuth stuff in `Authorization` header.)
+        that are different (OAuth stuff in `Authorization` header,
+        the format in `Accept`, and compression in `Accept-Encoding`.)
         
         This function works as follows:
             1 put post data in an easy to reach place
@@ -334,73 +2597,249 @@ class Resource(object):
                 2a if there is an expected api usage exception, it handles catching it and retuning the appropriate details
                 2b if there is an unexpected failure in the view, it will catch that and log it
             3 construct the response, using the appropriate amount of detail
-            4 render the response to json
+            4 render the response to json, or the format the Accept header asks for
+            5 compress it, if the client accepts that and it is big enough
+        
+        GETs can be answered with a 304 if the client already has the response,
+        or from the response cache.
         """
-        logging.info("     >>>> framework resource (enter)")
+        if self.metrics is None and not self.server_timing:
+            return self._respond(request, *args, **kwargs)
+        
+        profile = request.shimmer_profile = Profile()
+        with profile.timer('total'):
+            response = self._respond(request, *args, **kwargs)
+        self.report(request, response, profile)
+        return response
+    
+    def _respond(self, request, *args, **kwargs):
+        profile = getattr(request, 'shimmer_profile', None)
+        if TRACE:
+            resource_log.info("     >>>> framework resource (enter)")
+        etag = last_modified = None
+        media_type = request.shimmer_media_type = self.negotiate(request)
         # try to keep as much in the try block as possible, as we want pretty error messages at the least
         try:
             # try to find the user_id
             try:
-                request.user_id = self.auth(request)
+                with self._timer(profile, 'auth'):
+                    request.user_id = self.auth(request)
             except AttributeError:
                 pass
         
             rm = request.method.upper()
 
-            handler = self.handler
-            handler.status = None # reset status
-            # Translate nested datastructs into `request.data` here.
-            if rm in ('POST', 'PUT'):
-                mimer = Mimer()
-                mimer.translate(request)
+            handler = request.shimmer_handler = self.handler_for(request)
             
-            method_string = self.callmap.get(rm, None)
-            if method_string is None:
-                raise NotImplemented(rm)
-            meth = getattr(handler, method_string, False)
+            if rm == 'GET':
+                # if the handler can tell us the client already has the
+                # response, we don't need to make it
+                etag, last_modified = self.validators(request, *args, **kwargs)
+                if self.not_modified(request, etag, last_modified):
+                    return self.not_modified_response(etag, last_modified, weak=self.weak_etag(request))
             
-            # tries to call the view
-            logging.info("%s: %s" % (handler.__class__.__name__, self.callmap.get(rm)))
-            result = meth(request, *args, **kwargs)
+            cache_key = cached = None
+            if rm == 'GET' and self.cache is not None:
+                cache_key = self.cache_key(request, *args, **kwargs)
+                cached = self.cache.get(cache_key)
             
-            # construct the response using the appropriate detail then render to json
-            output_format = request.REQUEST.get('output','default')
-            try:
-                output_emitter = self.output[output_format]
-            except:
-                raise InvalidParameter("emission type", value=outputformat, fix="choose from [%s]" % "/".join(self.output.keys))
+            if cached is not None:
+                if resource_log.isEnabledFor(logging.INFO):
+                    resource_log.info("%s: cached response", handler.__class__.__name__)
+                (stream, mimetype), status = cached, 200
+            else:
+                stream, mimetype, status = self._handle(request, rm, handler, *args, **kwargs)
+                if cache_key is not None and status == 200 and isinstance(stream, str):
+                    self.cache.set(cache_key, (stream, mimetype), getattr(handler, 'cache_timeout', None))
             
-            emitter = output_emitter(request=request)# give request so we can lazily load the user only if necessary
-            mimetype = emitter.mimetype
+            if (rm == 'GET' and status == 200 and etag is None and self.etags
+                    and isinstance(stream, str)):
+                etag = hashlib.md5(stream).hexdigest()
+                if self.not_modified(request, etag, None):
+                    return self.not_modified_response(etag, last_modified, weak=self.weak_etag(request))
+        except Exception as e: #keep this stuff simple so we KNOW it works
+            error, status = self.error(e)
+            stream, mimetype = self.render_error(request, error, media_type)
+        
+        #logging.info(stream)
+        encoding = self.content_encoding(request, stream)
+        if encoding is not None:
+            with self._timer(profile, 'compress'):
+                stream = self.compressed(stream, encoding)
+            if profile is not None and isinstance(stream, str):
+                profile.count('compressed_bytes', len(stream))
+        resp = HttpResponse(stream, mimetype=mimetype, status=status)
+        if encoding is not None:
+            resp['Content-Encoding'] = encoding
+        if status == 200:
+            self.set_validators(resp, etag, last_modified, weak=self.weak_etag(request))
+        if TRACE:
+            resource_log.info(" <<<< framework resource (exit)")
+        return resp
+    
+    def set_validators(self, response, etag, last_modified, weak=False):
+        if etag is not None:
+            response['ETag'] = ('W/' if weak else '') + quote_etag(etag)
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+    
+    def not_modified_response(self, etag, last_modified, weak=False):
+        if TRACE:
+            resource_log.info(" <<<< framework resource (exit, not modified)")
+        response = HttpResponseNotModified()
+        self.set_validators(response, etag, last_modified, weak)
+        return response
+
+class ConstructedEmitter(Emitter):
+    """
+    Renders data that has already been constructed.
+    """
+    def _construct(self, data):
+        return data
 
+class BatchItemRequest(object):
+    """
+    The request for one item of a batch. Anything not specific to the
+    item comes from the batch's request.
+    """
+    def __init__(self, request, method, params, data):
+        self._request = request
+        self.method = method
+        self.REQUEST = self.GET = params
+        self.data = data
+    
+    def __getattr__(self, name):
+        return getattr(self._request, name)
 
-            construct = emitter._construct(data=result)
-            stream = emitter.render({'data':construct})
+class BatchHandler(BaseHandler):
+    """
+    Handles the POSTs to a `BatchResource`.
+    """
+    resource = None # set by the BatchResource
+    
+    def create(self, request):
+        return self.resource.dispatch(request)
+
+class BatchResource(Resource):
+    """
+    Lets clients make several requests in one, by POSTing a list of
+    requests like
+        {"method": "GET", "path": "/events/3/?output=mobile"}
+    or, for the resources given to the BatchResource by name,
+        {"method": "POST", "handler": "events", "kwargs": {"id": 3},
+         "params": {"output": "mobile", "tag": ["a", "b"]}, "data": {...}}
+    
+    The response has a status and data (or error) for each of them, in
+    order. With `share_emitter` the items that use the same emitter and
+    parameters are constructed together, so their manips run once for all
+    of them.
+    """
+    output = {'default': ConstructedEmitter}
+    
+    max_items = 20
+    share_emitter = True
+    
+    def __init__(self, resources=None):
+        super(BatchResource, self).__init__(BatchHandler)
+        self.resources = resources or {}
+        self.handler.resource = self
+    
+    def _item(self, request, item):
+        """
+        Returns the resource an item is for, and the request and arguments
+        to call it with.
+        """
+        if not isinstance(item, dict):
+            raise InvalidParameter("batch item", value=item)
+        params = QueryDict('', mutable=True)
+        for name, value in dict(item.get('params') or {}).iteritems():
+            # a list is a repeated parameter, as in ?tag=a&tag=b
+            params.setlist(name, value if isinstance(value, list) else [value])
+        args, kwargs = (), dict(item.get('kwargs') or {})
+        
+        if 'path' in item:
+            path, _, query = item['path'].partition('?')
+            try:
+                match = resolve(path)
+            except Http404:
+                raise DoesNotExist("resource", path=path)
+            resource = match.func
+            args = match.args
+            kwargs.update(match.kwargs)
+            for name, values in QueryDict(query).lists():
+                params.setlist(name, values)
+        else:
+            try:
+                resource = self.resources[item.get('handler')]
+            except KeyError:
+                raise InvalidParameter("handler", value=item.get('handler'), fix="choose from [%s]" % "/".join(self.resources.keys()))
+        
+        if not isinstance(resource, Resource) or isinstance(resource, BatchResource):
+            raise InvalidParameter("path", value=item.get('path'))
+        if 'output' in item:
+            params['output'] = item['output']
+        
+        method = str(item.get('method', 'GET')).upper()
+        return resource, BatchItemRequest(request, method, params, item.get('data', "")), args, kwargs
+    
+    def _authenticate(self, resource, request, users):
+        """
+        Runs the resource's auth for the item's request, each auth only
+        runs once per batch.
+        """
+        auth = getattr(type(resource), 'auth', None)
+        if auth is None:
+            return
+        auth = getattr(auth, '__func__', auth)
+        if auth not in users:
+            users[auth] = resource.auth(request)
+        request.user_id = users[auth]
+    
+    def dispatch(self, request):
+        items = request.data
+        if not isinstance(items, list):
+            raise InvalidParameter("batch", fix="POST a list of requests.")
+        if len(items) > self.max_items:
+            raise InvalidParameter("batch", fix="Make at most %s requests in a batch." % self.max_items)
+        
+        responses = [None] * len(items)
+        # (emitter class, params) -> (an item's request, {index: (result, status, extra)})
+        pending = collections.OrderedDict()
+        users = {}
+        for index, item in enumerate(items):
+            try:
+                resource, item_request, args, kwargs = self._item(request, item)
+                self._authenticate(resource, item_request, users)
+                handler = resource.handler_for(item_request)
+                result = resource._call_handler(item_request, item_request.method, handler, *args, **kwargs)
+                result, extra = resource._paged(item_request, item_request.method, result)
+                status = handler.status or 200
+                emitter = resource._emitter(item_request)
+                if not self.share_emitter:
+                    result = emitter._construct(result)
+            except Exception as e:
+                error, status = self.error(e)
+                responses[index] = dict(error, status=status)
+                continue
             
-            if handler.status is None:
-                status = 200
+            if self.share_emitter:
+                # the emitter can read the item's params, eg. `fields`, so only
+                # items with the same ones share it
+                key = (type(emitter), repr(sorted(item_request.GET.lists())))
+                pending.setdefault(key, (item_request, {}))[1][index] = (result, status, extra)
             else:
-                status = handler.status
-        except (APIException) as e:
-            stream = json.dumps(e.returnerror, indent=4)
-            status = e.status
-            mimetype = "application/json"
-        except Exception as e: #keep this stuff simple so we KNOW it works
-            logging.exception("Exception in API %s" % str(e))
-            status = 500
-            if settings.DEBUG:
-                stream = json.dumps({'error':{
-                                    'type':"APIError",
-                                    'message':("API (Django %s) crash report:\n\n%s" % 
-                        (django_version(), str(traceback.format_exc())))}}, indent=4)
-                mimetype = "application/json"
+                responses[index] = dict(extra, status=status, data=result)
+        
+        for (emitter_class, params), (item_request, results) in pending.iteritems():
+            try:
+                constructed = emitter_class(request=item_request)._construct(
+                    dict((index, result) for index, (result, status, extra) in results.iteritems()))
+            except Exception as e:
+                error, status = self.error(e)
+                for index in results:
+                    responses[index] = dict(error, status=status)
             else:
-                stream = json.dumps({'error':{
-                                    'type':"APIError",
-                                    'message':"An API error has occured, please try again later."}}, indent=4)
-                mimetype = "application/json"
+                for index, (result, status, extra) in results.iteritems():
+                    responses[index] = dict(extra, status=status, data=constructed[index])
         
-        #logging.info(stream)
-        resp = HttpResponse(stream, mimetype=mimetype, status=status)
-        logging.info(" <<<< framework resource (exit)")
-        return resp 
\ No newline at end of file
+        return responses
@@ -1 +1,3 @@
-from basic import *
\ No newline at end of file
+from basic import *
+from emitters import *
+from resources import *
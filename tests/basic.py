@@ -1,11 +1,14 @@
 import unittest
 import json
 import os
+import StringIO
+import urllib
 
 # Set the DJANGO_SETTINGS_MODULE environment variable.
 os.environ['DJANGO_SETTINGS_MODULE'] = "mock_settings"
 
 from django.db import models
+from django.http import QueryDict
 
 import rest_framework
 
@@ -13,14 +16,22 @@ class Request(object):
     def __init__(self, method, post_data=""):
         self._method = method
         self._post_data = post_data
-        self._REQUEST = {}
+        self._REQUEST = QueryDict("")
+        self.META = {}
+        self._stream = StringIO.StringIO(post_data)
     
     def set_get(self, **kwargs):
-        self._REQUEST = kwargs
+        # a list is a repeated parameter, as in ?tag=a&tag=b
+        self._REQUEST = QueryDict(urllib.urlencode(kwargs, True))
     
     @property
     def raw_post_data(self):
         return self._post_data
+    
+    def read(self, size=None):
+        if size is None:
+            return self._stream.read()
+        return self._stream.read(size)
         
     @property
     def method(self):
@@ -29,6 +40,10 @@ class Request(object):
     @property
     def REQUEST(self):
         return self._REQUEST
+    
+    @property
+    def GET(self):
+        return self._REQUEST
 
 class TestBasicOperations(unittest.TestCase):
     def test_get(self):
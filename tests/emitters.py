@@ -0,0 +1,786 @@
+# -*- coding: utf-8 -*-
+import unittest
+import datetime
+import decimal
+import json
+import os
+import sys
+import threading
+import time
+import traceback
+import uuid
+
+# Set the DJANGO_SETTINGS_MODULE environment variable.
+os.environ['DJANGO_SETTINGS_MODULE'] = "mock_settings"
+
+from django.core.management.color import no_style
+from django.db import connection
+from django.db import models
+from django.utils import datetime_safe
+
+import rest_framework
+
+from basic import Request
+
+class PlanLocation(models.Model):
+    name            =   models.CharField(max_length=100)
+
+class PlanEvent(models.Model):
+    name            =   models.CharField(max_length=100)
+    description     =   models.TextField()
+    start           =   models.DateTimeField()
+    day             =   models.DateField()
+    doors           =   models.TimeField()
+    price           =   models.DecimalField(max_digits=6, decimal_places=2)
+    capacity        =   models.IntegerField()
+    active          =   models.BooleanField()
+    location        =   models.ForeignKey(PlanLocation)
+
+def make_event(**kwargs):
+    fields = dict(id=7, name="gig", description=u"loud ☃",
+                  start=datetime.datetime(2012, 5, 4, 20, 30),
+                  day=datetime.date(2012, 5, 4), doors=datetime.time(19, 0),
+                  price=decimal.Decimal("12.50"), capacity=300, active=True,
+                  location_id=3)
+    fields.update(kwargs)
+    return PlanEvent(**fields)
+
+class TestModelPlans(unittest.TestCase):
+    def test_plan_output_matches_construct(self):
+        emitter = rest_framework.Emitter()
+        self.assertEqual(emitter.construct(make_event()), {
+            'id': 7,
+            'name': "gig",
+            'description': u"loud ☃",
+            'start': "2012-05-04T20:30:00+0000",
+            'day': "2012-05-04",
+            'doors': "19:00:00",
+            'price': "12.50",
+            'capacity': 300,
+            'location_id': 3,
+        })
+        
+    def test_plan_falls_back_on_unexpected_values(self):
+        emitter = rest_framework.Emitter()
+        output = emitter.construct(make_event(start=datetime.date(2012, 1, 2),
+                                              capacity=decimal.Decimal("1.5")))
+        self.assertEqual(output['start'], "2012-01-02")
+        self.assertEqual(output['capacity'], "1.5")
+    
+    def test_plan_is_shared_between_instances(self):
+        class PlanEmitter(rest_framework.Emitter):
+            pass
+        PlanEmitter().construct(make_event())
+        emitter = PlanEmitter()
+        self.assertFalse(PlanEvent in emitter._plans)
+        self.assertTrue((PlanEmitter, PlanEvent, emitter.exclude_fields, None) in rest_framework.Emitter._plan_cache)
+        
+    def test_plan_dropped_when_exclude_fields_change(self):
+        emitter = rest_framework.Emitter()
+        self.assertTrue('name' in emitter.construct(make_event()))
+        emitter.exclude_fields = ('active', '_state', 'name')
+        self.assertFalse('name' in emitter.construct(make_event()))
+        
+    def test_plan_respects_overridden_construct(self):
+        class ShoutingEmitter(rest_framework.Emitter):
+            def construct(self, thing):
+                if isinstance(thing, basestring):
+                    return thing.upper()
+                return super(ShoutingEmitter, self).construct(thing)
+        
+        self.assertEqual(ShoutingEmitter().construct(make_event())['name'], "GIG")
+
+class EventEmitter(rest_framework.Emitter):
+    def setup(self):
+        self.manips = [self.get_locations]
+        self.massagers = {PlanEvent: self.massage_event}
+        self.massaged = 0
+        
+    def get_locations(self):
+        for location_id in self.ids['locations']:
+            self.data['locations'][location_id] = PlanLocation(id=location_id, name="venue %s" % location_id)
+        
+    def massage_event(self, model_dict, model_instance):
+        if self.collecting:
+            self.ids['locations'].add(model_dict['location_id'])
+        else:
+            self.massaged += 1
+            model_dict['location'] = self.construct(self.data['locations'][model_dict.pop('location_id')])
+        return model_dict
+
+class SinglePassEventEmitter(EventEmitter):
+    single_pass = True
+
+class TestSinglePass(unittest.TestCase):
+    def payload(self):
+        return {'events': [make_event(id=1, location_id=1), make_event(id=2, location_id=2)],
+                'featured': (make_event(id=3, location_id=1),),
+                'when': datetime.date(2012, 1, 1)}
+        
+    def test_output_matches_two_passes(self):
+        self.assertEqual(SinglePassEventEmitter()._construct(self.payload()),
+                         EventEmitter()._construct(self.payload()))
+        
+    def test_only_holes_are_massaged_again(self):
+        emitter = SinglePassEventEmitter()
+        emitter.construct = CountingConstruct(emitter.construct)
+        output = emitter._construct(self.payload())
+        self.assertEqual(output['events'][1]['location']['name'], "venue 2")
+        self.assertEqual(emitter.massaged, 3)
+        # the collecting pass constructs the payload, the second pass only
+        # constructs each location
+        self.assertEqual(emitter.construct.models, 3 + 3)
+    
+    def test_model_at_the_root(self):
+        output = SinglePassEventEmitter()._construct(make_event(location_id=4))
+        self.assertEqual(output['location']['name'], "venue 4")
+        self.assertFalse('location_id' in output)
+
+class CountingConstruct(object):
+    def __init__(self, construct):
+        self.construct = construct
+        self.models = 0
+    
+    def __call__(self, thing):
+        if isinstance(thing, models.Model):
+            self.models += 1
+        return self.construct(thing)
+
+class TestConcurrentManips(unittest.TestCase):
+    def emitter(self, **kwargs):
+        class ConcurrentEmitter(rest_framework.Emitter):
+            manip_workers = 3
+            def setup(self):
+                self.manips = [self.get_cities, self.get_locations, self.get_photos]
+                self.manip_dependencies = {self.get_cities: [self.get_locations]}
+                self.massagers = {PlanEvent: self.massage_event}
+                self.threads = set()
+            
+            def get_locations(self):
+                time.sleep(0.05)
+                self.threads.add(threading.current_thread())
+                for location_id in self.ids['locations']:
+                    self.data['locations'][location_id] = {'city': location_id * 10}
+            
+            def get_cities(self):
+                self.threads.add(threading.current_thread())
+                for location in self.data['locations'].values():
+                    self.data['cities'][location['city']] = "city %s" % location['city']
+            
+            def get_photos(self):
+                time.sleep(0.05)
+                self.threads.add(threading.current_thread())
+                if kwargs.get('fail'):
+                    raise kwargs['fail']
+                self.data['photos'] = dict((i, "photo %s" % i) for i in self.ids['locations'])
+            
+            def massage_event(self, model_dict, model_instance):
+                if self.collecting:
+                    self.ids['locations'].add(model_dict['location_id'])
+                else:
+                    model_dict['city'] = self.data['cities'][model_dict['location_id'] * 10]
+                    model_dict['photo'] = self.data['photos'][model_dict['location_id']]
+                return model_dict
+        return ConcurrentEmitter()
+    
+    def test_runs_manips_on_threads(self):
+        emitter = self.emitter()
+        output = emitter._construct([make_event(location_id=1), make_event(location_id=2)])
+        self.assertEqual([(e['city'], e['photo']) for e in output],
+                         [("city 10", "photo 1"), ("city 20", "photo 2")])
+        self.assertFalse(threading.current_thread() in emitter.threads)
+    
+    def test_manip_errors_are_raised(self):
+        emitter = self.emitter(fail=rest_framework.DoesNotExist("photo", id=1))
+        self.assertRaises(rest_framework.DoesNotExist, emitter._construct, make_event())
+    
+    def test_manip_errors_keep_their_traceback(self):
+        emitter = self.emitter(fail=ZeroDivisionError())
+        try:
+            emitter._construct(make_event())
+        except ZeroDivisionError:
+            filename, line, function, text = traceback.extract_tb(sys.exc_info()[2])[-1]
+        else:
+            self.fail("ZeroDivisionError not raised")
+        self.assertEqual((function, text), ('get_photos', "raise kwargs['fail']"))
+    
+    def test_manip_errors_become_api_errors(self):
+        emitter_class = type(self.emitter(fail=ZeroDivisionError()))
+        class Handler(rest_framework.BaseHandler):
+            def read(slf, request):
+                return make_event()
+        class R(rest_framework.Resource):
+            output = {'default': emitter_class}
+        
+        output = R(Handler)(Request("get"))
+        self.assertEqual(json.loads(output.content)['error']['type'], 'APIError')
+        self.assertEqual(output.status_code, 500)
+        
+    def test_dependency_cycles_are_rejected(self):
+        emitter = self.emitter()
+        emitter.manip_dependencies[emitter.get_locations] = [emitter.get_cities]
+        self.assertRaises(ValueError, emitter._construct, make_event())
+    
+    def test_gathered_under_gevent(self):
+        emitter = self.emitter()
+        emitter.manip_workers = 0
+        emitter.gather_manips = True
+        cooperative = rest_framework.cooperative
+        rest_framework.cooperative = lambda: True
+        try:
+            output = emitter._construct([make_event(location_id=1)])
+        finally:
+            rest_framework.cooperative = cooperative
+        self.assertEqual((output[0]['city'], output[0]['photo']), ("city 10", "photo 1"))
+        self.assertFalse(threading.current_thread() in emitter.threads)
+        # only when asked for
+        self.assertFalse(self.emitter().gather_manips)
+        # threading isn't patched in the tests
+        self.assertFalse(rest_framework.cooperative())
+
+def create_tables(*model_classes):
+    cursor = connection.cursor()
+    for model in model_classes:
+        statements, references = connection.creation.sql_create_model(model, no_style())
+        for statement in statements:
+            cursor.execute(statement)
+
+class NestCity(models.Model):
+    name            =   models.CharField(max_length=100)
+
+class NestLocation(models.Model):
+    name            =   models.CharField(max_length=100)
+    city            =   models.ForeignKey(NestCity)
+
+class NestEvent(models.Model):
+    name            =   models.CharField(max_length=100)
+    location        =   models.ForeignKey(NestLocation)
+
+class NestedEmitter(rest_framework.Emitter):
+    collect_depth = 3
+    count_queries = True
+    
+    def setup(self):
+        self.manips = [self.get_locations, self.get_cities]
+        self.massagers = {NestEvent: self.massage_event, NestLocation: self.massage_location}
+        
+    def get_locations(self):
+        self.data['locations'] = NestLocation.objects.in_bulk(list(self.ids['locations']))
+        
+    def get_cities(self):
+        self.data['cities'] = NestCity.objects.in_bulk(list(self.ids['cities']))
+        
+    def massage_event(self, model_dict, model_instance):
+        if self.collecting:
+            self.ids['locations'].add(model_dict['location_id'])
+        else:
+            model_dict['location'] = self.construct(self.data['locations'][model_dict.pop('location_id')])
+        return model_dict
+        
+    def massage_location(self, model_dict, model_instance):
+        if self.collecting:
+            self.ids['cities'].add(model_dict['city_id'])
+        else:
+            model_dict['city'] = self.construct(self.data['cities'][model_dict.pop('city_id')])
+        return model_dict
+
+def create_nested_rows():
+    # whichever test class runs first creates the tables, each starts from
+    # the same rows
+    tables = connection.introspection.table_names()
+    create_tables(*[model for model in (NestCity, NestLocation, NestEvent)
+                    if model._meta.db_table not in tables])
+    NestEvent.objects.all().delete()
+    NestLocation.objects.all().delete()
+    NestCity.objects.all().delete()
+    for i in range(1, 3):
+        NestCity.objects.create(id=i, name="city %s" % i)
+        NestLocation.objects.create(id=i, name="venue %s" % i, city_id=i)
+    for i in range(1, 11):
+        NestEvent.objects.create(id=i, name="event %s" % i, location_id=i % 2 + 1)
+
+class TestNestedCollection(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        create_nested_rows()
+    
+    def test_nested_ids_are_collected(self):
+        emitter = NestedEmitter()
+        output = emitter._construct(NestEvent.objects.all())
+        self.assertEqual(len(output), 10)
+        self.assertEqual(output[0]['location'], {'id': 2, 'name': "venue 2", 'city': {'id': 2, 'name': "city 2"}})
+        # the events, the locations, then the cities
+        self.assertEqual(emitter.stats, {'rounds': 2, 'queries': 3})
+    
+    def test_single_pass_nested_ids_are_collected(self):
+        class SinglePassNestedEmitter(NestedEmitter):
+            single_pass = True
+        
+        emitter = SinglePassNestedEmitter()
+        self.assertEqual(emitter._construct(NestEvent.objects.all()),
+                         NestedEmitter()._construct(NestEvent.objects.all()))
+        self.assertEqual(emitter.stats, {'rounds': 2, 'queries': 3})
+    
+    def test_depth_limit(self):
+        class ShallowEmitter(NestedEmitter):
+            collect_depth = 1
+        
+        emitter = ShallowEmitter()
+        self.assertRaises(KeyError, emitter._construct, NestEvent.objects.all())
+        self.assertEqual(emitter.stats['rounds'], 1)
+    
+    def test_repeated_instances_are_memoized(self):
+        class CountingEmitter(NestedEmitter):
+            memoize = True
+            
+            def setup(self):
+                super(CountingEmitter, self).setup()
+                self.massaged = []
+                self.massagers[NestLocation] = self.count_location
+            
+            def count_location(self, model_dict, model_instance):
+                if not self.collecting:
+                    self.massaged.append(model_instance.pk)
+                return self.massage_location(model_dict, model_instance)
+        
+        class UnmemoizedEmitter(CountingEmitter):
+            memoize = False
+        unmemoized = UnmemoizedEmitter()
+        expected = unmemoized._construct(NestEvent.objects.all())
+        
+        emitter = CountingEmitter()
+        output = emitter._construct(NestEvent.objects.all())
+        self.assertEqual(output, expected)
+        # the 10 events only have 2 locations between them, which are each
+        # constructed twice
+        self.assertEqual(len(unmemoized.massaged) - len(emitter.massaged), 10 - 2 * 2)
+        self.assertEqual(output[-1]['location'], output[-3]['location'])
+        self.assertFalse(output[-1]['location'] is output[-3]['location'])
+        
+        class SharingEmitter(CountingEmitter):
+            memoize_shared = True
+        output = SharingEmitter()._construct(NestEvent.objects.all())
+        self.assertTrue(output[-1]['location'] is output[-3]['location'])
+        
+        class ExcludingEmitter(CountingEmitter):
+            memoize_exclude = frozenset([NestLocation])
+        emitter = ExcludingEmitter()
+        emitter._construct(NestEvent.objects.all())
+        self.assertEqual(len(emitter.massaged), len(unmemoized.massaged))
+
+class StreamEvent(models.Model):
+    name            =   models.CharField(max_length=100)
+    location_id     =   models.IntegerField()
+
+class StreamingEmitter(rest_framework.Emitter):
+    streaming = True
+    stream_batch_size = 4
+    
+    def setup(self):
+        self.manips = [self.get_locations]
+        self.massagers = {StreamEvent: self.massage_event}
+        self.batches = []
+        
+    fail_on_batch = None
+    
+    def get_locations(self):
+        self.batches.append(sorted(self.ids['locations']))
+        if len(self.batches) == self.fail_on_batch:
+            raise rest_framework.DoesNotExist("location", id=self.batches[-1][0])
+        for location_id in self.ids['locations']:
+            self.data['locations'][location_id] = "venue %s" % location_id
+    
+    def massage_event(self, model_dict, model_instance):
+        if self.collecting:
+            self.ids['locations'].add(model_dict['location_id'])
+        else:
+            model_dict['location'] = self.data['locations'][model_dict['location_id']]
+        return model_dict
+
+class TestStreaming(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        create_tables(StreamEvent)
+        for i in range(1, 11):
+            StreamEvent.objects.create(id=i, name="event %s" % i, location_id=i)
+    
+    def resource(self, queryset, fail_on_batch=None):
+        class Handler(rest_framework.BaseHandler):
+            def read(slf, request):
+                return queryset
+        class FailingEmitter(StreamingEmitter):
+            pass
+        FailingEmitter.fail_on_batch = fail_on_batch
+        class R(rest_framework.Resource):
+            output = {'default': FailingEmitter}
+        return R(Handler)
+    
+    def test_streams_in_batches(self):
+        emitter = StreamingEmitter()
+        chunks = list(emitter.stream(StreamEvent.objects.order_by('id')))
+        self.assertEqual(len(chunks), 4)
+        self.assertEqual(emitter.batches, [[1, 2, 3, 4], [5, 6, 7, 8], [9, 10]])
+        
+        data = json.loads(''.join(chunks))['data']
+        self.assertEqual([e['location'] for e in data], ["venue %s" % i for i in range(1, 11)])
+    
+    def test_streams_empty_queryset(self):
+        output = self.resource(StreamEvent.objects.none())(Request("get"))
+        self.assertEqual(json.loads(output.content), {'data': []})
+    
+    def test_error_in_first_batch(self):
+        output = self.resource(StreamEvent.objects.order_by('id'), fail_on_batch=1)(Request("get"))
+        self.assertEqual(output.status_code, 404)
+        self.assertEqual(json.loads(output.content)['error']['type'], "DoesNotExist")
+    
+    def test_error_in_later_batch(self):
+        output = self.resource(StreamEvent.objects.order_by('id'), fail_on_batch=2)(Request("get"))
+        content = json.loads(output.content)
+        self.assertEqual(output.status_code, 200)
+        self.assertEqual(len(content['data']), 4)
+        self.assertEqual(content['error']['type'], "DoesNotExist")
+
+class TestRendering(unittest.TestCase):
+    payload = {'data': [{'id': 1, 'name': u"caf\xe9 / bar", 'lat': 0.1 + 0.2, 'big': 1e20,
+                         'tags': ["a", "b"], 'none': None, 'ok': True}]}
+    
+    def test_compact_by_default(self):
+        self.assertEqual(rest_framework.Emitter().render({'data': [1, 2]}), '{"data":[1,2]}')
+    
+    def test_pretty_when_asked(self):
+        request = Request("get")
+        request.set_get(pretty='1')
+        self.assertEqual(rest_framework.Emitter(request).render({'data': [1]}),
+                         json.dumps({'data': [1]}, indent=4))
+        
+        class PrettyEmitter(rest_framework.Emitter):
+            pretty = True
+        self.assertEqual(PrettyEmitter().render({'data': [1]}), json.dumps({'data': [1]}, indent=4))
+    
+    def test_backends_give_identical_output(self):
+        expected = rest_framework.Emitter().render(self.payload)
+        for name in rest_framework.json_backends:
+            class BackendEmitter(rest_framework.Emitter):
+                json_backend = name
+            self.assertEqual(BackendEmitter().render(self.payload), expected, name)
+    
+    def test_errors_follow_pretty(self):
+        resource = rest_framework.Resource(rest_framework.BaseHandler)
+        output = resource(Request("get"))
+        self.assertFalse('\n' in output.content)
+        
+        request = Request("get")
+        request.set_get(pretty='1')
+        output = resource(request)
+        self.assertTrue('\n' in output.content)
+        self.assertEqual(json.loads(output.content)['error']['type'], 'NotImplemented')
+
+class TestConverters(unittest.TestCase):
+    def test_mixed_payload(self):
+        class Shout(unicode):
+            pass
+        payload = {'list': [1, long(2), 1.5, None, True, "str", u"uni", Shout(u"sub")],
+                   'tuple': (decimal.Decimal("1.10"), datetime.time(10, 30)),
+                   'nested': {'when': datetime.datetime(2012, 1, 2, 3, 4, 5),
+                              'day': datetime.date(2012, 1, 2)},
+                   'other': ValueError("x")}
+        self.assertEqual(rest_framework.Emitter().construct(payload), {
+            'list': [1, long(2), 1.5, None, True, "str", u"uni", u"sub"],
+            'tuple': ["1.10", "10:30:00"],
+            'nested': {'when': "2012-01-02T03:04:05+0000", 'day': "2012-01-02"},
+            'other': u"x"})
+    
+    def test_register_converter(self):
+        class UUIDEmitter(rest_framework.Emitter):
+            pass
+        class SubUUID(uuid.UUID):
+            pass
+        value = uuid.UUID(int=5)
+        
+        rest_framework.Emitter().construct(value)
+        UUIDEmitter.register_converter(uuid.UUID, lambda emitter, u: u.hex)
+        self.assertEqual(UUIDEmitter().construct([value, SubUUID(int=6)]),
+                         [value.hex, SubUUID(int=6).hex])
+        self.assertEqual(rest_framework.Emitter().construct(value), unicode(value))
+        
+        class SubEmitter(UUIDEmitter):
+            pass
+        self.assertEqual(SubEmitter().construct(value), value.hex)
+    
+    def test_converter_can_be_a_method(self):
+        class Point(object):
+            def __init__(self, x, y):
+                self.x, self.y = x, y
+        class PointEmitter(rest_framework.Emitter):
+            def _point(self, point):
+                return [point.x, self.construct(point.y)]
+        PointEmitter.register_converter(Point, '_point')
+        self.assertEqual(PointEmitter().construct({'p': Point(1, decimal.Decimal("2.5"))}), {'p': [1, "2.5"]})
+
+    def test_registered_converters_apply_to_fields(self):
+        class EpochEmitter(rest_framework.Emitter):
+            pass
+        event = make_event()
+        EpochEmitter().construct(event)
+        EpochEmitter.register_converter(datetime.datetime, lambda emitter, value: "EPOCH")
+        self.assertEqual(EpochEmitter().construct(event)['start'], "EPOCH")
+        self.assertEqual(EpochEmitter().construct(event)['day'], "2012-05-04")
+        self.assertEqual(rest_framework.Emitter().construct(event)['start'], "2012-05-04T20:30:00+0000")
+
+class ProjectionEmitter(NestedEmitter):
+    count_queries = True
+    
+    def setup(self):
+        super(ProjectionEmitter, self).setup()
+        self.manip_fields = {self.get_locations: ['location'], self.get_cities: ['location']}
+        self.manip_dependencies = {self.get_cities: [self.get_locations]}
+    
+    def massage_event(self, model_dict, model_instance):
+        if self.wants('location'):
+            return super(ProjectionEmitter, self).massage_event(model_dict, model_instance)
+        return model_dict
+
+class FixedOffset(datetime.tzinfo):
+    def utcoffset(self, dt):
+        return datetime.timedelta(hours=-5)
+    
+    def dst(self, dt):
+        return datetime.timedelta(0)
+
+class TestTemporal(unittest.TestCase):
+    """
+        The ISO formats are written out by hand, so check them against
+        strftime, which is how they used to be made.
+    """
+    def strftime(self, value, format):
+        if isinstance(value, datetime.datetime):
+            value = datetime_safe.new_datetime(value.replace(tzinfo=rest_framework.UTC))
+        elif isinstance(value, datetime.date):
+            value = datetime_safe.new_date(value)
+        return value.strftime(format)
+    
+    def test_same_as_strftime(self):
+        emitter = rest_framework.Emitter()
+        values = []
+        for year in (1, 999, 1850, 1899, 1900, 1970, 2012, 2038, 9999):
+            values.append(datetime.date(year, 12, 31))
+            if year >= 1900:
+                values.append(datetime.datetime(year, 1, 2, 3, 4, 5, 678))
+                values.append(datetime.datetime(year, 10, 11, 23, 59, 59, tzinfo=FixedOffset()))
+        values.extend([datetime.time(0, 0), datetime.time(23, 59, 59, 999999)])
+        
+        formats = {datetime.datetime: "%Y-%m-%dT%H:%M:%S%z", datetime.date: "%Y-%m-%d",
+                   datetime.time: "%H:%M:%S"}
+        for value in values:
+            self.assertEqual(emitter.construct(value), self.strftime(value, formats[type(value)]))
+    
+    def test_pre_1900_datetimes(self):
+        # strftime can't do these, but they are still treated as UTC
+        self.assertEqual(rest_framework.Emitter().construct(datetime.datetime(1850, 3, 4, 5, 6, 7)),
+                         "1850-03-04T05:06:07+0000")
+    
+    def test_other_formats(self):
+        emitter = rest_framework.Emitter()
+        emitter.DATETIME_FORMAT = "%d/%m/%Y %H:%M %Z"
+        emitter.DATE_FORMAT = "%d %B %Y"
+        emitter.TIME_FORMAT = "%I%p"
+        self.assertEqual(emitter.construct([datetime.datetime(2012, 5, 4, 20, 30),
+                                            datetime.date(1850, 5, 4), datetime.time(20, 30)]),
+                         ["04/05/2012 20:30 UTC", "04 May 1850", "08PM"])
+
+class TestProjection(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        create_nested_rows()
+    
+    def emitter(self, fields, emitter_class=ProjectionEmitter):
+        request = Request("get")
+        request.set_get(fields=fields)
+        return emitter_class(request)
+    
+    def test_parse_fields(self):
+        self.assertEqual(rest_framework.parse_fields("id, name,location(name,city(id)),x"),
+                         {'id': None, 'name': None, 'x': None,
+                          'location': {'name': None, 'city': {'id': None}}})
+        self.assertEqual(rest_framework.parse_fields(""), None)
+        for bad in ["id,", "(id)", "location(name", "id)", "a(b),,c"]:
+            self.assertRaises(rest_framework.InvalidParameter, rest_framework.parse_fields, bad)
+    
+    def test_unmassaged_models_only_load_fields_asked_for(self):
+        emitter = self.emitter("id,name", rest_framework.Emitter)
+        output = emitter._construct(NestCity.objects.order_by('id'))
+        self.assertEqual(output, [{'id': 1, 'name': "city 1"}, {'id': 2, 'name': "city 2"}])
+        
+        emitter = self.emitter("name", rest_framework.Emitter)
+        output = emitter._construct(NestLocation.objects.order_by('id'))
+        self.assertEqual(output, [{'name': "venue 1"}, {'name': "venue 2"}])
+        queryset = emitter._project_queryset(NestLocation.objects.all(), emitter.projection)
+        self.assertEqual(queryset.query.deferred_loading, (set(['name']), False))
+    
+    def test_nested_projection(self):
+        emitter = self.emitter("name,location(name,city(name))")
+        output = emitter._construct(NestEvent.objects.order_by('id'))
+        self.assertEqual(output[0], {'name': "event 1", 'location': {'name': "venue 2", 'city': {'name': "city 2"}}})
+    
+    def test_skips_manips_for_fields_not_asked_for(self):
+        emitter = self.emitter("id,name")
+        output = emitter._construct(NestEvent.objects.order_by('id'))
+        self.assertEqual(output[0], {'id': 1, 'name': "event 1"})
+        self.assertEqual(emitter.stats, {'rounds': 0, 'queries': 1})
+        self.assertEqual(emitter._wanted_manips(), [])
+        emitter = self.emitter("location")
+        self.assertEqual(emitter._wanted_manips(), emitter.manips)
+    
+    def test_bad_fields_parameter(self):
+        class Handler(rest_framework.BaseHandler):
+            def read(slf, request):
+                return "hi"
+        request = Request("get")
+        request.set_get(fields="id,(")
+        output = rest_framework.Resource(Handler)(request)
+        self.assertEqual(output.status_code, 400)
+        self.assertEqual(json.loads(output.content)['error']['type'], "InvalidParameter")
+
+class EntityCity(models.Model):
+    name            =   models.CharField(max_length=100)
+
+class TestEntityCache(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        create_tables(EntityCity)
+    
+    def setUp(self):
+        EntityCity.objects.all().delete()
+        self.cities = [EntityCity.objects.create(name="city %s" % i) for i in range(3)]
+    
+    def emitter(self, cache):
+        class CityEmitter(rest_framework.Emitter):
+            entity_caches = {'cities': cache}
+            count_queries = True
+            
+            def setup(self):
+                self.manips = [self.get_cities]
+            
+            def get_cities(self):
+                self.data['cities'] = self.cached_in_bulk('cities')
+            
+            def _dict(self, data):
+                if self.collecting:
+                    self.ids['cities'].add(data['city_id'])
+                    return None
+                return {'city': self.data['cities'][data['city_id']].name}
+        return CityEmitter()
+    
+    def construct(self, cache, *city_ids):
+        emitter = self.emitter(cache)
+        data = emitter._construct([{'city_id': self.cities[i].pk} for i in city_ids])
+        return [item['city'] for item in data], emitter.stats['queries']
+    
+    def test_read_through(self):
+        for cache in (rest_framework.EntityCache(EntityCity),
+                      rest_framework.EntityCache(EntityCity, rest_framework.DjangoCache())):
+            self.assertEqual(self.construct(cache, 0, 1), (["city 0", "city 1"], 1))
+            self.assertEqual(self.construct(cache, 1, 0), (["city 1", "city 0"], 0))
+            self.assertEqual(self.construct(cache, 2, 1), (["city 2", "city 1"], 1))
+            self.assertEqual((cache.hits, cache.misses), (3, 3))
+            cache.cache.clear()
+    
+    def test_invalidated_by_signals(self):
+        cache = rest_framework.EntityCache(EntityCity)
+        self.construct(cache, 0, 1)
+        self.cities[0].name = "renamed"
+        self.cities[0].save()
+        self.assertEqual(self.construct(cache, 0, 1), (["renamed", "city 1"], 1))
+        self.assertEqual((cache.hits, cache.misses), (1, 3))
+        
+        pk = self.cities[1].pk
+        self.cities[1].delete()
+        self.assertEqual(cache.in_bulk([pk]), {})
+    
+    def test_invalidated_by_bulk_updates(self):
+        class Handler(rest_framework.BulkHandler):
+            model = EntityCity
+        cache = rest_framework.EntityCache(EntityCity)
+        self.construct(cache, 0, 1)
+        rest_framework.Resource(Handler)(Request("put", json.dumps([{'id': self.cities[0].pk, 'name': "renamed"}])))
+        self.assertEqual(self.construct(cache, 0, 1), (["renamed", "city 1"], 1))
+
+class ValuesCity(models.Model):
+    name            =   models.CharField(max_length=100)
+
+class ValuesEvent(models.Model):
+    name            =   models.CharField(max_length=100)
+    start           =   models.DateTimeField(null=True)
+    price           =   models.DecimalField(max_digits=6, decimal_places=2)
+    active          =   models.BooleanField()
+    city            =   models.ForeignKey(ValuesCity)
+
+class TestValuesPath(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        create_tables(ValuesCity, ValuesEvent)
+        city = ValuesCity.objects.create(name=u"caf\xe9 city")
+        for i in range(5):
+            ValuesEvent.objects.create(name="event %s" % i, price=decimal.Decimal("%s.50" % i), active=True,
+                                       start=datetime.datetime(2012, 5, i + 1, 20) if i % 2 else None,
+                                       city=city)
+    
+    def construct(self, emitter_class, data, fields=''):
+        request = Request("get")
+        request.set_get(fields=fields)
+        emitter = emitter_class(request)
+        emitter.profile = rest_framework.Profile()
+        output = emitter._construct(data)
+        return output, emitter.stats['queries'], emitter.profile.counts['models']
+    
+    def assertSameAsInstances(self, emitter_class, data, fields=''):
+        """
+            `data` is called for a fresh copy for each emitter, so the second
+            doesn't see the first's result caches.
+        """
+        class InstanceEmitter(emitter_class):
+            values_path = False
+        output, queries, models = self.construct(emitter_class, data(), fields)
+        self.assertEqual(output, self.construct(InstanceEmitter, data(), fields)[0])
+        return queries, models
+    
+    def test_same_as_instances(self):
+        class CountingEmitter(rest_framework.Emitter):
+            count_queries = True
+        events = lambda: ValuesEvent.objects.order_by('pk')
+        self.assertEqual(self.assertSameAsInstances(CountingEmitter, events), (1, 5))
+        self.assertSameAsInstances(CountingEmitter, events, fields="name,start")
+        self.assertSameAsInstances(CountingEmitter, lambda: events().only('name'))
+    
+    def test_alongside_massaged_models(self):
+        class CityEmitter(NestedEmitter):
+            def setup(self):
+                self.manips = [self.get_cities]
+                self.massagers = {ValuesCity: self.massage_city}
+            
+            def get_cities(self):
+                self.data['cities'] = ValuesCity.objects.in_bulk(list(self.ids['cities']))
+            
+            def massage_city(self, model_dict, model_instance):
+                if self.collecting:
+                    self.ids['cities'].add(model_dict['id'])
+                else:
+                    model_dict['big'] = True
+                return model_dict
+        
+        data = lambda: {'events': ValuesEvent.objects.order_by('pk'), 'cities': ValuesCity.objects.all()}
+        # the cities, the events once for both passes, then the manip
+        self.assertEqual(self.assertSameAsInstances(CityEmitter, data)[0], 3)
+    
+    def test_not_used_when_it_would_differ(self):
+        class ModelEmitter(rest_framework.Emitter):
+            def _model(self, data):
+                return data.name
+        self.assertEqual(self.construct(ModelEmitter, ValuesEvent.objects.order_by('pk'))[0][0], "event 0")
+        self.assertFalse(ModelEmitter()._can_use_values(ValuesEvent.objects.all()))
+        
+        emitter = rest_framework.Emitter()
+        self.assertTrue(emitter._can_use_values(ValuesEvent.objects.all()))
+        self.assertFalse(emitter._can_use_values(ValuesEvent.objects.extra(select={'x': "1"})))
+        emitter.massagers[ValuesEvent] = lambda model_dict, model_instance: model_dict
+        self.assertFalse(emitter._can_use_values(ValuesEvent.objects.all()))
@@ -0,0 +1,781 @@
+import unittest
+import datetime
+import json
+import os
+import threading
+import time
+import zlib
+
+# Set the DJANGO_SETTINGS_MODULE environment variable.
+os.environ['DJANGO_SETTINGS_MODULE'] = "mock_settings"
+
+from django.db import connection
+from django.db import models
+
+import rest_framework
+
+from basic import Request
+from emitters import create_tables
+
+class TestLocalCache(unittest.TestCase):
+    def test_evicts_least_recently_used(self):
+        cache = rest_framework.LocalCache(max_entries=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual(cache.get_many(['a', 'b', 'c']), {'a': 1, 'c': 3})
+    
+    def test_entries_expire(self):
+        cache = rest_framework.LocalCache()
+        cache.set('a', 1, timeout=-1)
+        cache.set('b', 2, timeout=60)
+        self.assertEqual(cache.get('a'), None)
+        self.assertEqual(cache.get('b'), 2)
+
+class TestResponseCache(unittest.TestCase):
+    def resource(self):
+        calls = []
+        
+        class Handler(rest_framework.BaseHandler):
+            def read(slf, request, event_id):
+                calls.append(event_id)
+                return {'event': event_id, 'version': len(calls)}
+            
+            def update(slf, request, event_id):
+                slf.invalidate_cache()
+                return "updated"
+        
+        class R(rest_framework.Resource):
+            cache = rest_framework.ResponseCache(timeout=60)
+            def auth(self, request):
+                return getattr(request, 'as_user', None)
+        
+        return R(Handler), calls
+    
+    def get(self, resource, event_id, user=None, django_user=None, **params):
+        request = Request("get")
+        request.set_get(**params)
+        request.as_user = user
+        if django_user is not None:
+            request.user = django_user
+        return resource(request, event_id=event_id)
+    
+    def test_repeated_gets_are_cached(self):
+        resource, calls = self.resource()
+        first = self.get(resource, 1)
+        second = self.get(resource, 1)
+        self.assertEqual(calls, [1])
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second.status_code, 200)
+    
+    def test_key_varies(self):
+        resource, calls = self.resource()
+        self.get(resource, 1)
+        self.get(resource, 2)
+        self.get(resource, 1, user="someone")
+        self.get(resource, 1, pretty="1")
+        self.assertEqual(len(calls), 4)
+    
+    def test_key_varies_by_repeated_parameters(self):
+        resource, calls = self.resource()
+        self.get(resource, 1, tag=["a", "b"])
+        self.get(resource, 1, tag=["c", "b"])
+        self.get(resource, 1, tag=["a", "b"])
+        self.assertEqual(len(calls), 2)
+    
+    def test_key_varies_by_django_user(self):
+        class User(object):
+            def __init__(self, pk):
+                self.pk = pk
+        resource, calls = self.resource()
+        self.get(resource, 1, django_user=User(1))
+        self.get(resource, 1, django_user=User(2))
+        self.get(resource, 1, django_user=User(1))
+        self.assertEqual(len(calls), 2)
+    
+    def test_invalidated_by_handler(self):
+        resource, calls = self.resource()
+        self.get(resource, 1)
+        resource(Request("put"), event_id=1)
+        self.assertEqual(json.loads(self.get(resource, 1).content)['data']['version'], 2)
+    
+    def test_errors_are_not_cached(self):
+        class Handler(rest_framework.BaseHandler):
+            def read(slf, request):
+                raise rest_framework.DoesNotExist("event", id=1)
+        class R(rest_framework.Resource):
+            cache = rest_framework.ResponseCache()
+        resource = R(Handler)
+        resource(Request("get"))
+        # only the handler's version is in the cache
+        self.assertEqual(len(resource.cache.cache._entries), 1)
+
+class TestConditionalGet(unittest.TestCase):
+    def get(self, resource, **headers):
+        request = Request("get")
+        request.META = headers
+        return resource(request)
+    
+    def test_etag_from_body(self):
+        class Handler(rest_framework.BaseHandler):
+            def read(slf, request):
+                return "unchanged"
+        class R(rest_framework.Resource):
+            etags = True
+        resource = R(Handler)
+        
+        first = self.get(resource)
+        self.assertEqual(first.status_code, 200)
+        self.assertTrue(first.has_header('ETag'))
+        
+        second = self.get(resource, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(second['ETag'], first['ETag'])
+        self.assertEqual(second.content, "")
+        
+        self.assertEqual(self.get(resource, HTTP_IF_NONE_MATCH='"stale"').status_code, 200)
+    
+    def test_handler_etag_skips_read(self):
+        reads = []
+        class Handler(rest_framework.BaseHandler):
+            def etag(slf, request):
+                return 3
+            def read(slf, request):
+                reads.append(1)
+                return "version 3"
+        resource = rest_framework.Resource(Handler)
+        
+        first = self.get(resource)
+        self.assertEqual(self.get(resource, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+        self.assertEqual(self.get(resource, HTTP_IF_NONE_MATCH='*').status_code, 304)
+        self.assertEqual(len(reads), 1)
+        
+        request = Request("get")
+        request.set_get(output='default', pretty='1')
+        self.assertNotEqual(resource(request)['ETag'], first['ETag'])
+        
+        etags = []
+        for tags in (["a", "b"], ["c", "b"]):
+            request = Request("get")
+            request.set_get(tag=tags)
+            etags.append(resource(request)['ETag'])
+        self.assertNotEqual(etags[0], etags[1])
+    
+    def test_last_modified(self):
+        class Handler(rest_framework.BaseHandler):
+            def last_modified(slf, request):
+                return datetime.datetime(2012, 5, 4, 12, 0)
+            def read(slf, request):
+                return "hi"
+        resource = rest_framework.Resource(Handler)
+        
+        first = self.get(resource)
+        self.assertEqual(first['Last-Modified'], "Fri, 04 May 2012 12:00:00 GMT")
+        self.assertEqual(self.get(resource, HTTP_IF_MODIFIED_SINCE="Fri, 04 May 2012 12:00:00 GMT").status_code, 304)
+        self.assertEqual(self.get(resource, HTTP_IF_MODIFIED_SINCE="Fri, 04 May 2012 11:59:59 GMT").status_code, 200)
+
+class LocationEmitter(rest_framework.Emitter):
+    def setup(self):
+        self.manips = [self.get_locations]
+    
+    def get_locations(self):
+        self.data['locations'] = dict((i, "venue %s" % i) for i in self.ids['locations'])
+    
+    def _dict(self, data):
+        if 'location_id' in data:
+            if self.collecting:
+                self.ids['locations'].add(data['location_id'])
+            else:
+                return {'location': self.data['locations'][data['location_id']]}
+        return super(LocationEmitter, self)._dict(data)
+
+class TestBatch(unittest.TestCase):
+    def resource(self):
+        lookups = []
+        
+        class CountingEmitter(LocationEmitter):
+            def get_locations(self):
+                lookups.append(sorted(self.ids['locations']))
+                super(CountingEmitter, self).get_locations()
+        
+        class EventHandler(rest_framework.BaseHandler):
+            def read(slf, request, event_id):
+                if event_id == 404:
+                    raise rest_framework.DoesNotExist("event", id=event_id)
+                return {'location_id': event_id % 2}
+            
+            def create(slf, request):
+                slf.status = 201
+                return request.data
+        
+        class Events(rest_framework.Resource):
+            output = {'default': rest_framework.Emitter, 'located': CountingEmitter}
+        
+        return rest_framework.BatchResource({'events': Events(EventHandler)}), lookups
+    
+    def post(self, resource, items):
+        return resource(Request("post", json.dumps(items)))
+    
+    def test_dispatches_each_item(self):
+        resource, lookups = self.resource()
+        output = self.post(resource, [
+            {'handler': "events", 'kwargs': {'event_id': 1}},
+            {'handler': "events", 'method': "post", 'data': {'name': "new"}},
+            {'handler': "events", 'kwargs': {'event_id': 404}},
+            {'handler': "nope"},
+            {'handler': "events", 'method': "delete"},
+        ])
+        self.assertEqual(output.status_code, 200)
+        data = json.loads(output.content)['data']
+        self.assertEqual(data[0], {'status': 200, 'data': {'location_id': 1}})
+        self.assertEqual(data[1], {'status': 201, 'data': {'name': "new"}})
+        self.assertEqual((data[2]['status'], data[2]['error']['type']), (404, "DoesNotExist"))
+        self.assertEqual((data[3]['status'], data[3]['error']['type']), (400, "InvalidParameter"))
+        self.assertEqual((data[4]['status'], data[4]['error']['type']), (405, "NotImplemented"))
+    
+    def test_shares_manips_between_items(self):
+        resource, lookups = self.resource()
+        output = self.post(resource, [
+            {'handler': "events", 'kwargs': {'event_id': i}, 'output': "located"} for i in range(4)])
+        data = json.loads(output.content)['data']
+        self.assertEqual([item['data']['location'] for item in data], ["venue 0", "venue 1"] * 2)
+        self.assertEqual(lookups, [[0, 1]])
+    
+    def test_repeated_params_are_kept_apart(self):
+        resource, lookups = self.resource()
+        self.post(resource, [
+            {'handler': "events", 'kwargs': {'event_id': i}, 'output': "located", 'params': {'tag': tags}}
+            for i, tags in enumerate([["a", "b"], ["c", "b"], ["a", "b"]])])
+        self.assertEqual(lookups, [[0], [1]])
+    
+    def test_item_params_are_used_when_shared(self):
+        class VenueHandler(rest_framework.BaseHandler):
+            def read(slf, request, venue_id):
+                return BulkVenue(id=venue_id, name="hall", capacity=5)
+        for share_emitter in (True, False):
+            resource = rest_framework.BatchResource({'venues': rest_framework.Resource(VenueHandler)})
+            resource.share_emitter = share_emitter
+            data = json.loads(self.post(resource, [
+                {'handler': "venues", 'kwargs': {'venue_id': 1}, 'params': {'fields': "name"}},
+                {'handler': "venues", 'kwargs': {'venue_id': 2}},
+                {'handler': "venues", 'kwargs': {'venue_id': 3}, 'params': {'fields': "name"}},
+            ]).content)['data']
+            self.assertEqual([item['data'] for item in data],
+                             [{'name': "hall"}, {'id': 2, 'name': "hall", 'capacity': 5}, {'name': "hall"}])
+    
+    def test_rejects_too_many_items(self):
+        resource, lookups = self.resource()
+        output = self.post(resource, [{'handler': "events", 'kwargs': {'event_id': 1}}] * 21)
+        self.assertEqual(output.status_code, 400)
+
+class TestProfiling(unittest.TestCase):
+    def resource(self, **attrs):
+        class EventHandler(rest_framework.BaseHandler):
+            def read(slf, request):
+                return [{'location_id': i % 2} for i in range(4)]
+        
+        R = type('R', (rest_framework.Resource,), dict(attrs, output={'default': LocationEmitter}))
+        return R(EventHandler)
+    
+    def test_reports_phases_to_metrics(self):
+        metrics = rest_framework.MemoryMetrics()
+        response = self.resource(metrics=metrics)(Request("get"))
+        self.assertFalse(response.has_header('Server-Timing'))
+        
+        for phase in ('total', 'handler', 'pre_construct', 'manips', 'manip.get_locations',
+                      'construct', 'render'):
+            self.assertEqual(len(metrics.timings['shimmer.EventHandler.%s' % phase]), 1, phase)
+        self.assertEqual(metrics.histograms['shimmer.EventHandler.ids'], [2])
+        self.assertEqual(metrics.histograms['shimmer.EventHandler.bytes'], [len(response.content)])
+        self.assertEqual(metrics.counters['shimmer.EventHandler.status.200'], 1)
+    
+    def test_server_timing_header(self):
+        response = self.resource(server_timing=True)(Request("get"))
+        phases = [timing.split(';')[0] for timing in response['Server-Timing'].split(', ')]
+        self.assertEqual(phases[-1], 'total')
+        self.assertTrue('manip.get_locations' in phases)
+    
+    def test_off_by_default(self):
+        request = Request("get")
+        response = self.resource()(request)
+        self.assertFalse(response.has_header('Server-Timing'))
+        self.assertFalse(hasattr(request, 'shimmer_profile'))
+
+class TestMimer(unittest.TestCase):
+    def translate(self, body, mimer=None, **meta):
+        class SmallChunks(rest_framework.Mimer):
+            streaming = True
+            chunk_size = 5
+            batch_size = 2
+        request = Request("post", body)
+        request.META = meta
+        (mimer or SmallChunks)().translate(request)
+        return request.data
+    
+    def test_streams_list_items(self):
+        items = [1234567, -0.5e10, u"caf\xe9 \u2603", {'a': [1, {'b': None}]}, [], True, u"]", 10]
+        body = json.dumps(items, ensure_ascii=False).encode('utf-8')
+        data = self.translate(body)
+        self.assertTrue(isinstance(data, rest_framework.DecodedStream))
+        self.assertEqual(list(data), items)
+        self.assertEqual(list(self.translate(" [ ] ")), [])
+        self.assertEqual(list(self.translate("[1,2,3,4,5]").batches()), [[1, 2], [3, 4], [5]])
+    
+    def test_other_bodies_are_decoded_whole(self):
+        self.assertEqual(self.translate('  {"a": [1, 2, 3]}'), {'a': [1, 2, 3]})
+        self.assertEqual(self.translate(''), "")
+    
+    def test_ndjson(self):
+        data = self.translate('{"id": 1}\n\n{"id": 2}\n{"id": 3}', mimer=rest_framework.Mimer,
+                              CONTENT_TYPE="application/x-ndjson; charset=utf-8")
+        self.assertEqual(list(data), [{'id': 1}, {'id': 2}, {'id': 3}])
+    
+    def test_malformed_stream(self):
+        for body in ('[1, 2', '[1 2]', '[1,]', '[1] 2', '[{"a": }]'):
+            self.assertRaises(rest_framework.InvalidParameter, list, self.translate(body))
+    
+    def test_max_body_size(self):
+        class Limited(rest_framework.Mimer):
+            max_body_size = 10
+        self.assertRaises(rest_framework.InvalidParameter, self.translate, '[1]', mimer=Limited,
+                          CONTENT_LENGTH="11")
+        self.assertRaises(rest_framework.InvalidParameter, self.translate, '[1, 2, 3, 4]', mimer=Limited)
+        
+        class LimitedStream(Limited):
+            streaming = True
+            chunk_size = 4
+        data = self.translate('[1, 2, 3, 4, 5, 6]', mimer=LimitedStream)
+        self.assertRaises(rest_framework.InvalidParameter, list, data)
+    
+    def test_handler_creates_in_batches(self):
+        batches = []
+        class Handler(rest_framework.BaseHandler):
+            def create(slf, request):
+                for batch in request.data.batches(3):
+                    batches.append(batch)
+                return len(batches)
+        class Streaming(rest_framework.Mimer):
+            streaming = True
+        class R(rest_framework.Resource):
+            mimer = Streaming
+        
+        response = R(Handler)(Request("post", json.dumps(range(7))))
+        self.assertEqual(json.loads(response.content)['data'], 3)
+        self.assertEqual(batches, [[0, 1, 2], [3, 4, 5], [6]])
+        
+        response = R(Handler)(Request("post", '[1, 2, 3, 4, oops]'))
+        self.assertEqual(response.status_code, 400)
+
+class BulkVenue(models.Model):
+    name            =   models.CharField(max_length=20)
+    capacity        =   models.IntegerField(default=100)
+
+class BulkShow(models.Model):
+    title           =   models.CharField(max_length=100)
+    venue           =   models.ForeignKey(BulkVenue)
+    day             =   models.DateField()
+
+class BulkCountry(models.Model):
+    code            =   models.CharField(max_length=2, primary_key=True)
+    name            =   models.CharField(max_length=50)
+
+class TestBulkHandler(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        create_tables(BulkVenue, BulkShow, BulkCountry)
+    
+    def setUp(self):
+        BulkShow.objects.all().delete()
+        BulkVenue.objects.all().delete()
+        self.venue = BulkVenue.objects.create(name="hall")
+        
+        class Handler(rest_framework.BulkHandler):
+            model = BulkShow
+            models = {'venue': BulkVenue}
+            batch_size = 2
+        self.resource = rest_framework.Resource(Handler)
+    
+    def call(self, method, items):
+        return json.loads(self.resource(Request(method, json.dumps(items))).content)['data']
+    
+    def test_create(self):
+        connection.use_debug_cursor, queries = True, len(connection.queries)
+        try:
+            results = self.call("post", [
+                {'title': "first", 'venue_id': self.venue.pk, 'day': "2012-05-04"},
+                {'title': "second", 'venue_id': self.venue.pk, 'day': "2012-05-05"},
+                {'title': "third", 'venue_id': self.venue.pk, 'day': "not a day"},
+                {'title': "fourth", 'venue_id': self.venue.pk, 'day': "2012-05-06", 'nope': 1},
+                {'type': "venue", 'name': "park"},
+                {'title': "fifth", 'venue_id': self.venue.pk, 'day': "2012-05-07"},
+                {'title': "sixth", 'venue_id': 999, 'day': "2012-05-08"},
+            ])
+            # the venues are checked, then two batches of shows and a venue
+            self.assertEqual(len(connection.queries) - queries, 4)
+        finally:
+            connection.use_debug_cursor = None
+        self.assertEqual([result['status'] for result in results], [201, 201, 400, 400, 201, 201, 400])
+        self.assertEqual(results[6]['error']['type'], "InvalidParameter")
+        self.assertEqual(results[2]['error']['type'], "InvalidParameter")
+        self.assertEqual(results[0]['data']['day'], "2012-05-04")
+        self.assertEqual(sorted(BulkShow.objects.values_list('title', flat=True)), ["fifth", "first", "second"])
+        self.assertEqual(BulkVenue.objects.filter(name="park").count(), 1)
+    
+    def test_update(self):
+        shows = [BulkShow.objects.create(title="show %s" % i, venue=self.venue, day=datetime.date(2012, 5, 4))
+                 for i in range(3)]
+        results = self.call("put", [
+            {'id': shows[0].pk, 'day': "2012-06-01"},
+            {'id': shows[1].pk, 'day': "2012-06-01"},
+            {'id': shows[2].pk, 'title': "renamed"},
+            {'id': 999, 'title': "missing"},
+            {'title': "no id"},
+        ])
+        self.assertEqual([result['status'] for result in results], [200, 200, 200, 404, 400])
+        self.assertEqual(results[0]['data'], {'id': shows[0].pk})
+        self.assertEqual([(show.title, show.day) for show in BulkShow.objects.order_by('pk')],
+                         [("show 0", datetime.date(2012, 6, 1)), ("show 1", datetime.date(2012, 6, 1)),
+                          ("renamed", datetime.date(2012, 5, 4))])
+    
+    def test_update_foreign_key(self):
+        other = BulkVenue.objects.create(name="park")
+        show = BulkShow.objects.create(title="show", venue=self.venue, day=datetime.date(2012, 5, 4))
+        results = self.call("put", [{'id': show.pk, 'venue_id': other.pk}, {'id': show.pk, 'venue_id': [1]},
+                                    {'id': show.pk, 'venue_id': 999}, {'id': show.pk, 'venue_id': "x"}])
+        self.assertEqual([result['status'] for result in results], [200, 400, 400, 400])
+        self.assertEqual(BulkShow.objects.get(pk=show.pk).venue_id, other.pk)
+    
+    def test_delete(self):
+        shows = [BulkShow.objects.create(title="show %s" % i, venue=self.venue, day=datetime.date(2012, 5, 4))
+                 for i in range(3)]
+        results = self.call("delete", [shows[0].pk, {'id': shows[2].pk}, 999])
+        self.assertEqual([result['status'] for result in results], [200, 200, 404])
+        self.assertEqual(list(BulkShow.objects.values_list('title', flat=True)), ["show 1"])
+    
+    def test_named_primary_key(self):
+        class Handler(rest_framework.BulkHandler):
+            model = BulkCountry
+        self.resource = rest_framework.Resource(Handler)
+        BulkCountry.objects.all().delete()
+        for code in ("fr", "de", "nz"):
+            BulkCountry.objects.create(code=code, name=code)
+        
+        results = self.call("put", [{'code': "fr", 'name': "France"}, {'code': "xx", 'name': "nowhere"}])
+        self.assertEqual([result['status'] for result in results], [200, 404])
+        self.assertEqual(results[0]['data'], {'code': "fr"})
+        self.assertEqual(BulkCountry.objects.get(pk="fr").name, "France")
+        
+        results = self.call("delete", ["de", {'code': "nz"}, "xx"])
+        self.assertEqual([result['status'] for result in results], [200, 200, 404])
+        self.assertEqual(results[0]['data'], {'code': "de"})
+        self.assertEqual(list(BulkCountry.objects.values_list('code', flat=True)), ["fr"])
+    
+    def test_rejects_non_lists(self):
+        response = self.resource(Request("post", json.dumps({'title': "one"})))
+        self.assertEqual(response.status_code, 400)
+
+class PageVenue(models.Model):
+    name            =   models.CharField(max_length=20)
+
+class PageEvent(models.Model):
+    name            =   models.CharField(max_length=20)
+    day             =   models.DateField()
+    venue           =   models.ForeignKey(PageVenue)
+
+class TestPagination(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        create_tables(PageVenue, PageEvent)
+    
+    def setUp(self):
+        PageEvent.objects.all().delete()
+        PageVenue.objects.all().delete()
+        venues = [PageVenue.objects.create(name="venue %s" % i) for i in range(10)]
+        for i in range(10):
+            PageEvent.objects.create(name="event %s" % i, day=datetime.date(2012, 5, 1 + i % 3),
+                                     venue=venues[i])
+        
+        lookups = self.lookups = []
+        class VenueEmitter(rest_framework.Emitter):
+            def setup(self):
+                self.manips = [self.get_venues]
+            
+            def get_venues(self):
+                lookups.append(sorted(self.ids['venues']))
+                self.data['venues'] = PageVenue.objects.in_bulk(self.ids['venues'])
+            
+            def _model(self, data):
+                if self.collecting:
+                    self.ids['venues'].add(data.venue_id)
+                    return None
+                return {'name': data.name, 'venue': self.data['venues'][data.venue_id].name}
+        
+        class Handler(rest_framework.BaseHandler):
+            def read(slf, request):
+                return PageEvent.objects.order_by('-day')
+        class R(rest_framework.Resource):
+            paginate = True
+            page_size = 4
+            output = {'default': rest_framework.Emitter, 'venues': VenueEmitter}
+        self.resource = R(Handler)
+    
+    def get(self, **params):
+        request = Request("get")
+        request.set_get(**params)
+        return self.resource(request)
+    
+    def test_pages_through_everything(self):
+        expected = [event.name for event in PageEvent.objects.order_by('-day', 'pk')]
+        names, cursor, pages = [], None, 0
+        while True:
+            params = {'output': "venues"}
+            if cursor is not None:
+                params['cursor'] = cursor
+            output = json.loads(self.get(**params).content)
+            names.extend(event['name'] for event in output['data'])
+            pages += 1
+            cursor = output['next']
+            if cursor is None:
+                break
+        self.assertEqual(names, expected)
+        self.assertEqual(pages, 3)
+        # the manips only looked up the venues of each page
+        self.assertEqual([len(ids) for ids in self.lookups], [4, 4, 2])
+    
+    def test_limit(self):
+        output = json.loads(self.get(limit="10").content)
+        self.assertEqual((len(output['data']), output['next']), (10, None))
+        for limit in ("0", "101", "many"):
+            self.assertEqual(self.get(limit=limit).status_code, 400)
+    
+    def test_bad_cursor(self):
+        self.assertEqual(self.get(cursor="nonsense").status_code, 400)
+        self.assertEqual(self.get(cursor=rest_framework.encode_cursor([1])).status_code, 400)
+    
+    def test_streamed_pages(self):
+        class Streaming(rest_framework.Emitter):
+            streaming = True
+        self.resource.output = {'default': Streaming}
+        output = json.loads(''.join(self.get(limit="3").content))
+        self.assertEqual(len(output['data']), 3)
+        self.assertEqual(len(json.loads(self.get(cursor=output['next']).content)['data']), 4)
+    
+    def test_unpageable_ordering_pages_by_pk(self):
+        class Handler(rest_framework.BaseHandler):
+            def read(slf, request):
+                return PageEvent.objects.order_by('venue__name')
+        self.resource.handler = Handler()
+        output = json.loads(self.get(limit="6").content)
+        self.assertEqual([event['id'] for event in output['data']],
+                         list(PageEvent.objects.order_by('pk').values_list('pk', flat=True)[:6]))
+        self.assertEqual(len(json.loads(self.get(cursor=output['next']).content)['data']), 4)
+    
+    def test_extra_ordering(self):
+        class Handler(rest_framework.BaseHandler):
+            def read(slf, request):
+                return PageEvent.objects.extra(order_by=['-day'])
+        self.resource.handler = Handler()
+        output = json.loads(self.get(limit="6").content)
+        self.assertEqual([event['name'] for event in output['data']],
+                         [event.name for event in PageEvent.objects.order_by('-day', 'pk')[:6]])
+        
+        # an ordering by something other than the model's own fields can't
+        # be paged by
+        class Handler(rest_framework.BaseHandler):
+            def read(slf, request):
+                return PageEvent.objects.extra(select={'weekday': "day"}, order_by=['-weekday'])
+        self.resource.handler = Handler()
+        output = json.loads(self.get(limit="6").content)
+        self.assertEqual([event['id'] for event in output['data']],
+                         list(PageEvent.objects.order_by('pk').values_list('pk', flat=True)[:6]))
+    
+    def test_sliced_querysets_are_not_paged(self):
+        class Handler(rest_framework.BaseHandler):
+            def read(slf, request):
+                return PageEvent.objects.order_by('-day')[:5]
+        self.resource.handler = Handler()
+        response = self.get(limit="3")
+        self.assertEqual(response.status_code, 200)
+        output = json.loads(response.content)
+        self.assertEqual((len(output['data']), output['next']), (5, None))
+    
+    def test_batch_items_are_paged(self):
+        batch = rest_framework.BatchResource({'events': self.resource})
+        data = json.loads(batch(Request("post", json.dumps([
+            {'handler': "events", 'params': {'limit': "3"}},
+            {'handler': "events", 'params': {'limit': "3", 'output': "venues"}},
+        ]))).content)['data']
+        self.assertEqual([len(item['data']) for item in data], [3, 3])
+        self.assertEqual(data[0]['next'], data[1]['next'])
+        self.assertEqual(len(json.loads(self.get(cursor=data[0]['next']).content)['data']), 4)
+
+class TestContentNegotiation(unittest.TestCase):
+    def setUp(self):
+        class Handler(rest_framework.BaseHandler):
+            def read(slf, request):
+                if request.REQUEST.get('missing'):
+                    raise rest_framework.DoesNotExist("event", id=3)
+                return [{'id': 1, 'name': u"caf\xe9"}]
+        self.resource = rest_framework.Resource(Handler)
+    
+    def get(self, accept=None, **params):
+        request = Request("get")
+        request.set_get(**params)
+        request.META = {} if accept is None else {'HTTP_ACCEPT': accept}
+        return self.resource(request)
+    
+    def test_best_media_type(self):
+        types = ('application/json', 'application/x-msgpack')
+        self.assertEqual(rest_framework.best_media_type(None, types), 'application/json')
+        self.assertEqual(rest_framework.best_media_type("*/*", types), 'application/json')
+        self.assertEqual(rest_framework.best_media_type("application/x-msgpack, */*;q=0.1", types), 'application/x-msgpack')
+        self.assertEqual(rest_framework.best_media_type("application/*;q=0.5, application/json;q=0.2", types), 'application/x-msgpack')
+        self.assertEqual(rest_framework.best_media_type("application/json;q=0, */*", types), 'application/x-msgpack')
+        self.assertEqual(rest_framework.best_media_type("text/html", types), None)
+    
+    def test_msgpack(self):
+        response = self.get("application/x-msgpack")
+        self.assertEqual(response['Content-Type'], 'application/x-msgpack')
+        self.assertEqual(response.content, rest_framework.msgpack_dumps({'data': [{'id': 1, 'name': u"caf\xe9"}]}))
+        self.assertTrue('Accept' in response['Vary'])
+        
+        response = self.get("text/html,application/xml;q=0.9,*/*;q=0.8")
+        self.assertEqual(json.loads(response.content), {'data': [{'id': 1, 'name': u"caf\xe9"}]})
+        self.assertEqual(self.get("image/png")['Content-Type'], 'application/json; charset=utf-8')
+    
+    def test_errors(self):
+        response = self.get("application/msgpack", missing="1")
+        self.assertEqual((response.status_code, response['Content-Type']), (404, 'application/msgpack'))
+        self.assertEqual(response.content, rest_framework.msgpack_dumps(rest_framework.DoesNotExist("event", id=3).returnerror))
+    
+    def test_fallback_encoder(self):
+        self.assertEqual(rest_framework._msgpack_dumps({u'a': [1, -1, 200, -200, 70000, 1.5, None, True, u"\xe9"]}),
+                         "\x81\xa1a\x99\x01\xff\xcc\xc8\xd1\xff\x38\xce\x00\x01\x11\x70"
+                         "\xcb\x3f\xf8\x00\x00\x00\x00\x00\x00\xc0\xc3\xa2\xc3\xa9")
+        try:
+            import msgpack
+        except ImportError:
+            return
+        data = {'ints': [0, 127, 128, 255, 256, 65535, 65536, 2 ** 32, 2 ** 64 - 1,
+                         -32, -33, -128, -129, -2 ** 15 - 1, -2 ** 31 - 1, -2 ** 63],
+                'text': [u"", "a" * 31, u"\xe9" * 16, "b" * 256, u"c" * 70000],
+                'nested': dict((str(i), range(i)) for i in range(20)),
+                'other': [0.1, -1e300, False, None, ()]}
+        self.assertEqual(rest_framework._msgpack_dumps(data), msgpack.packb(data, use_bin_type=False))
+
+class TestCompression(unittest.TestCase):
+    def setUp(self):
+        class Handler(rest_framework.BaseHandler):
+            def read(slf, request):
+                return [{'id': i, 'name': u"event %s" % i} for i in range(int(request.REQUEST.get('n', 100)))]
+        class R(rest_framework.Resource):
+            etags = True
+        self.resource = R(Handler)
+    
+    def get(self, accept_encoding=None, **params):
+        request = Request("get")
+        request.set_get(**params)
+        request.META = {} if accept_encoding is None else {'HTTP_ACCEPT_ENCODING': accept_encoding}
+        return self.resource(request)
+    
+    def test_gzip(self):
+        plain = self.get()
+        response = self.get("gzip, deflate")
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertTrue('Accept-Encoding' in response['Vary'])
+        self.assertTrue(len(response.content) < len(plain.content) / 3)
+        self.assertEqual(zlib.decompress(response.content, 16 + zlib.MAX_WBITS), plain.content)
+        # the same body always compresses the same
+        self.assertEqual(self.get("gzip").content, response.content)
+        
+        self.assertEqual(response['ETag'], 'W/' + plain['ETag'])
+        self.assertEqual(self.get("gzip", HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+        request = Request("get")
+        request.META = {'HTTP_ACCEPT_ENCODING': "gzip", 'HTTP_IF_NONE_MATCH': response['ETag']}
+        self.assertEqual(self.resource(request).status_code, 304)
+    
+    def test_handler_etag_is_weak_like_the_response(self):
+        class Handler(rest_framework.BaseHandler):
+            def etag(slf, request):
+                return 1
+            def read(slf, request):
+                return [u"event %s" % i for i in range(200)]
+        resource = rest_framework.Resource(Handler)
+        for accept_encoding in ("gzip", "identity"):
+            request = Request("get")
+            request.META = {'HTTP_ACCEPT_ENCODING': accept_encoding}
+            response = resource(request)
+            request = Request("get")
+            request.META = {'HTTP_ACCEPT_ENCODING': accept_encoding, 'HTTP_IF_NONE_MATCH': response['ETag']}
+            not_modified = resource(request)
+            self.assertEqual(not_modified.status_code, 304)
+            self.assertEqual(not_modified['ETag'], response['ETag'])
+            self.assertEqual(response['ETag'].startswith('W/'), accept_encoding == "gzip")
+    
+    def test_deflate(self):
+        response = self.get("gzip;q=0, deflate")
+        self.assertEqual(response['Content-Encoding'], 'deflate')
+        self.assertEqual(zlib.decompress(response.content), self.get().content)
+    
+    def test_compressed_bytes_are_counted(self):
+        metrics = self.resource.metrics = rest_framework.MemoryMetrics()
+        response = self.get("gzip")
+        self.assertEqual(metrics.histograms['shimmer.Handler.compressed_bytes'], [len(response.content)])
+    
+    def test_not_compressed(self):
+        for response in (self.get("gzip", n="2"), self.get("identity"), self.get("br;q=0, *;q=0")):
+            self.assertFalse(response.has_header('Content-Encoding'))
+            self.assertEqual(json.loads(response.content)['data'][0]['id'], 0)
+        # the ETag is weak whenever the response could have been compressed
+        self.assertTrue(self.get("gzip", n="2")['ETag'].startswith('W/'))
+        self.assertFalse(self.get("identity")['ETag'].startswith('W/'))
+        self.resource.compress = False
+        self.assertFalse(self.get("gzip").has_header('Content-Encoding'))
+    
+    def test_streamed(self):
+        chunks = [u'{"data":[', u'"caf\xe9",' * 500, u'1]}']
+        compressed = rest_framework.compress_chunks(iter(chunks), rest_framework.compressors['gzip'](6))
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        # each chunk can be decoded as soon as it arrives
+        for chunk in chunks:
+            self.assertEqual(decompressor.decompress(next(compressed)), chunk.encode('utf-8'))
+        self.assertEqual(decompressor.decompress(''.join(compressed)), "")
+
+class TestConcurrentRequests(unittest.TestCase):
+    def test_no_state_shared(self):
+        class Handler(rest_framework.BaseHandler):
+            def read(slf, request):
+                slf.status = int(request.REQUEST['status'])
+                slf.seen = request.REQUEST['n']
+                # let the other threads set theirs in between
+                time.sleep(0.001)
+                return [slf.seen, slf.status]
+        resource = rest_framework.Resource(Handler)
+        resource.handler.prefix = "shared"
+        
+        results, errors = [], []
+        def run(thread):
+            try:
+                for i in range(20):
+                    n = "%s-%s" % (thread, i)
+                    status = (200, 201, 202, 203)[(thread + i) % 4]
+                    request = Request("get")
+                    request.set_get(n=n, status=str(status))
+                    response = resource(request)
+                    results.append(((n, status), (json.loads(response.content)['data'][0], response.status_code)))
+            except Exception as e:
+                errors.append(e)
+        threads = [threading.Thread(target=run, args=(thread,)) for thread in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        self.assertEqual(errors, [])
+        self.assertEqual(len(results), 400)
+        for expected, got in results:
+            self.assertEqual(got, expected)
+        # the handler the resource was made with is left as it was
+        self.assertEqual((resource.handler.status, resource.handler.prefix), (None, "shared"))
+        self.assertFalse(hasattr(resource.handler, 'seen'))